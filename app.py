@@ -1,9 +1,48 @@
-from flask import Flask, request, render_template_string
+from flask import Flask, request, render_template, g, has_request_context, url_for, jsonify
+from jinja2 import ChoiceLoader, DictLoader
+from markupsafe import Markup
 import random
+from array import array
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta, date
+import click
+import cProfile
 import csv
+import gzip
+import hashlib
+import hmac
+import http.client
 import io
+import itertools
+import marshal
+import math
+import mmap
+import multiprocessing
+import os
+import pickle
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.error
 import urllib.request
+import zlib
+import json
+from collections import Counter, OrderedDict, deque
+from urllib.parse import urljoin, urlsplit
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+try:
+    import brotli  # opcional: si está instalado, se ofrece "br"
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl  # para que un solo proceso construya las tablas de un juego
+except ImportError:
+    fcntl = None
 
 app = Flask(__name__)
 
@@ -19,9 +58,68 @@ PAYROLL_DAYS = {14, 15, 29, 30}
 DEFAULT_SORTEOS_CSV = "https://docs.google.com/spreadsheets/d/e/2PACX-1vTy9U4tfHkyG-DmVoCIBWAub5xFPRGH9Di1jDIM3dcNFMpyjfN4yNetJOUf8oGZ1c2zNJbeq0-7pCtv/pub?gid=1014698381&single=true&output=csv"
 DEFAULT_JUGADAS_CSV = "https://docs.google.com/spreadsheets/d/e/2PACX-1vTy9U4tfHkyG-DmVoCIBWAub5xFPRGH9Di1jDIM3dcNFMpyjfN4yNetJOUf8oGZ1c2zNJbeq0-7pCtv/pub?gid=1636174563&single=true&output=csv"
 
-
-def parse_int_list(s: str):
-    """Parsea '3, 7,10  11' -> [3,7,10,11] validando 1..39, únicos."""
+# ✅ Carpeta privada de la app (dentro del proyecto, no en el /tmp compartido)
+DATA_DIR = os.environ.get("MILOTO_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".miloto"))
+
+# ✅ Snapshot en disco para arrancar en frío sin esperar a Sheets
+SNAPSHOT_PATH = os.environ.get("MILOTO_SNAPSHOT", os.path.join(DATA_DIR, "snapshot.pkl.gz"))
+DATA_TTL_SECONDS = int(os.environ.get("MILOTO_DATA_TTL", "300"))
+
+# ✅ Presupuesto de memoria para datos en cache (LRU)
+DATA_BUDGET_BYTES = int(float(os.environ.get("MILOTO_DATA_BUDGET_MB", "64")) * 1024 * 1024)
+DERIVED_BUDGET_BYTES = int(float(os.environ.get("MILOTO_DERIVED_BUDGET_MB", "16")) * 1024 * 1024)
+
+# ✅ Hot con decaimiento temporal (vida media en sorteos)
+DECAY_HALF_LIVES = [5, 10, 20, 40, 80]
+DEFAULT_HALF_LIFE = 20
+
+# ✅ Generación masiva de boletos
+BULK_MAX_TICKETS = int(os.environ.get("MILOTO_BULK_MAX", "1000000"))
+BULK_PROCESSES = int(os.environ.get("MILOTO_BULK_PROCESSES", str(min(4, os.cpu_count() or 1))))
+BULK_PARALLEL_MIN_ROWS = 2000000  # filas de la tabla del juego; debajo, filtrar en el mismo proceso es más rápido
+
+# ✅ Verificación masiva de boletos subidos (CSV)
+VERIFY_MAX_BYTES = int(float(os.environ.get("MILOTO_VERIFY_MAX_MB", "32")) * 1024 * 1024)
+VERIFY_MAX_MATCHES = int(os.environ.get("MILOTO_VERIFY_MAX_MATCHES", "1000"))
+VERIFY_BATCH_ROWS = 20000
+
+# ✅ Juegos k de n y sus tablas precalculadas (archivos mapeados en memoria)
+GAMES_CONFIG = os.environ.get("MILOTO_GAMES", "")
+DEFAULT_GAME = "miloto"
+# (dentro del proyecto: `flask build-tables` los deja listos en el build y llegan al runtime)
+TABLES_DIR = os.environ.get("MILOTO_TABLES_DIR", os.path.join(DATA_DIR, "tables"))
+
+# ✅ Perfilado bajo demanda (?_profile=1|summary|download con X-Profile-Token)
+PROFILE_TOKEN = os.environ.get("MILOTO_PROFILE_TOKEN", "")
+PROFILE_KEEP = int(os.environ.get("MILOTO_PROFILE_KEEP", "20"))
+
+# ✅ Registro de grupos (tenants): ruta a un JSON o el JSON directo
+TENANTS_CONFIG = os.environ.get("MILOTO_TENANTS", "")
+
+# ✅ Límites de tiempo y circuit breaker para Google Sheets
+FETCH_TIMEOUT = float(os.environ.get("MILOTO_FETCH_TIMEOUT", "4"))
+FETCH_RETRIES = int(os.environ.get("MILOTO_FETCH_RETRIES", "2"))
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("MILOTO_REQUEST_DEADLINE", "8"))
+BREAKER_WINDOW = 10          # últimas N descargas por URL
+BREAKER_MIN_CALLS = 3        # no abrir con menos muestras que esto
+BREAKER_FAILURE_RATE = 0.5   # abre si falla >= 50% de la ventana
+BREAKER_COOLDOWN = float(os.environ.get("MILOTO_BREAKER_COOLDOWN", "30"))
+
+# ✅ Transporte HTTP: conexiones keep-alive por host, gzip/deflate y tope de tamaño
+HTTP_POOL_PER_HOST = int(os.environ.get("MILOTO_HTTP_POOL", "4"))
+HTTP_IDLE_SECONDS = float(os.environ.get("MILOTO_HTTP_IDLE", "60"))
+FETCH_MAX_BYTES = int(float(os.environ.get("MILOTO_FETCH_MAX_MB", "32")) * 1024 * 1024)
+HTTP_MAX_REDIRECTS = 5
+
+# ✅ Compresión de respuestas
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_MIMETYPES = {"text/html", "application/json", "text/css", "text/javascript",
+                      "application/javascript", "text/csv", "text/plain"}
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+
+def parse_int_list(s: str, max_number: int = MAX_NUMBER):
+    """Parsea '3, 7,10  11' -> [3,7,10,11] validando 1..max_number (39 por defecto), únicos."""
     if not s:
         return []
     parts = [p.strip() for p in s.replace(";", ",").split(",")]
@@ -32,8 +130,8 @@ def parse_int_list(s: str):
         if not p.isdigit():
             raise ValueError("Solo se permiten números separados por comas.")
         n = int(p)
-        if n < 1 or n > MAX_NUMBER:
-            raise ValueError(f"Número fuera de rango (1..{MAX_NUMBER}): {n}")
+        if n < 1 or n > max_number:
+            raise ValueError(f"Número fuera de rango (1..{max_number}): {n}")
         nums.append(n)
 
     seen = set()
@@ -122,6 +220,71 @@ def weekly_weights_for_dates(week_dates):
     return weights
 
 
+# ---------- Juegos (reglas k de n) ----------
+
+# Súbelo al cambiar el código de las reglas (is_valid_combination) o de las columnas de las tablas:
+# cambia la huella de cada juego y las tablas viejas en disco ya no se usan.
+RULES_VERSION = 1
+
+
+class Game:
+    """
+    Un juego "k de n": cuántos números lleva el boleto, hasta qué número llega y los filtros
+    del plan. Los filtros que no se indican se escalan desde MiLoto (5 de 39):
+    bajos <= n/2, máximo > 80% de n, suma entre 0.5 y 1.5 veces la suma media.
+    """
+
+    __slots__ = ("id", "name", "picks", "max_number", "low_max", "max_floor", "sum_min", "sum_max")
+
+    def __init__(self, game_id: str, name: str, picks: int, max_number: int,
+                 low_max: int = None, max_floor: int = None, sum_min: int = None, sum_max: int = None):
+        if not 2 <= picks < max_number <= 63:
+            raise ValueError(f"Juego {game_id!r}: se necesita 2 <= picks < max_number <= 63")
+        mean_sum = picks * (max_number + 1) / 2
+        self.id = game_id
+        self.name = name
+        self.picks = picks
+        self.max_number = max_number
+        self.low_max = max_number // 2 if low_max is None else low_max
+        self.max_floor = round(max_number * 0.8) if max_floor is None else max_floor
+        self.sum_min = round(mean_sum * 0.5) if sum_min is None else sum_min
+        self.sum_max = round(mean_sum * 1.5) if sum_max is None else sum_max
+
+    def rules(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__ if k != "name"}
+
+    def fingerprint(self) -> str:
+        """Cambia si cambia cualquier regla (o RULES_VERSION): las tablas en disco se rehacen solas."""
+        data = {"rules": self.rules(), "version": RULES_VERSION}
+        return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def load_games(config: str = None):
+    """
+    MiLoto + Baloto (solo los 5 de 43, sin superbalota) + MILOTO_GAMES (ruta a JSON o JSON directo):
+    {"loto-6-45": {"name": "Loto 6/45", "picks": 6, "max_number": 45, "sum_min": 70}}
+    """
+    games = {
+        "miloto": Game("miloto", "MiLoto", NUM_NUMBERS, MAX_NUMBER,
+                       low_max=19, max_floor=31, sum_min=50, sum_max=150),
+        "baloto": Game("baloto", "Baloto (5 de 43)", 5, 43),
+    }
+    config = GAMES_CONFIG if config is None else config
+    if config.strip():
+        if config.lstrip().startswith("{"):
+            data = json.loads(config)
+        else:
+            with open(config, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        for gid, g in data.items():
+            games[gid] = Game(gid, g.get("name", gid), int(g["picks"]), int(g["max_number"]),
+                              **{k: int(g[k]) for k in ("low_max", "max_floor", "sum_min", "sum_max") if k in g})
+    return games
+
+
+GAMES = load_games()
+
+
 def has_run_of_three_or_more(sorted_nums):
     """True si existe secuencia consecutiva de longitud >= 3."""
     longest = 1
@@ -135,10 +298,37 @@ def has_run_of_three_or_more(sorted_nums):
     return longest >= 3
 
 
-def generate_combination(hot_numbers, hot_count, allow_sequences: bool):
+def is_valid_combination(comb_list, allow_sequences: bool, game: Game = None) -> bool:
+    """Reglas del plan sobre una combinación ordenada (MiLoto si no se indica juego)."""
+    game = game or GAMES[DEFAULT_GAME]
+    evens = sum(1 for n in comb_list if n % 2 == 0)
+    if evens in (0, game.picks):
+        return False
+
+    lows = sum(1 for n in comb_list if n <= game.low_max)
+    if lows in (0, game.picks):
+        return False
+
+    # ✅ Permitir o no secuencias
+    if not allow_sequences:
+        if has_run_of_three_or_more(comb_list):
+            return False
+
+    if max(comb_list) <= game.max_floor:
+        return False
+
+    s = sum(comb_list)
+    if s < game.sum_min or s > game.sum_max:
+        return False
+
+    return True
+
+
+def generate_combination(hot_numbers, hot_count, allow_sequences: bool, game: Game = None):
     """Genera 1 combinación válida usando hot_numbers y hot_count (0..3)."""
-    all_nums = list(range(1, MAX_NUMBER + 1))
-    hot_numbers = [n for n in hot_numbers if 1 <= n <= MAX_NUMBER]
+    game = game or GAMES[DEFAULT_GAME]
+    all_nums = list(range(1, game.max_number + 1))
+    hot_numbers = [n for n in hot_numbers if 1 <= n <= game.max_number]
     hot_set = set(hot_numbers)
     non_hot = [n for n in all_nums if n not in hot_set]
 
@@ -151,47 +341,326 @@ def generate_combination(hot_numbers, hot_count, allow_sequences: bool):
         if hot_count > 0:
             comb.update(random.sample(hot_numbers, hot_count))
 
-        needed = NUM_NUMBERS - len(comb)
+        needed = game.picks - len(comb)
         pool = non_hot if len(non_hot) >= needed else all_nums
         comb.update(random.sample(pool, needed))
 
         comb_list = sorted(comb)
-        if len(comb_list) != NUM_NUMBERS:
+        if len(comb_list) != game.picks:
             continue
 
-        evens = sum(1 for n in comb_list if n % 2 == 0)
-        if evens in (0, 5):
+        if not is_valid_combination(comb_list, allow_sequences, game):
             continue
 
-        lows = sum(1 for n in comb_list if n <= 19)
-        if lows in (0, 5):
-            continue
+        return comb_list
+
+
+# ---------- Google Sheets CSV helpers ----------
+
+class CircuitOpenError(Exception):
+    """La fuente viene fallando: no se intenta descargar hasta que pase el cooldown."""
+
+
+class CircuitBreaker:
+    """
+    Breaker por URL:
+    - closed: pasa todo; registra éxito/fallo en una ventana móvil.
+    - open: si la tasa de fallos supera el umbral, rechaza de inmediato durante el cooldown.
+    - half_open: tras el cooldown deja pasar UNA prueba; si sale bien cierra, si no reabre.
+    """
+
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 failure_rate=BREAKER_FAILURE_RATE, cooldown=BREAKER_COOLDOWN):
+        self.results = deque(maxlen=window)
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = "half_open"
+            if self.trial_running:
+                return False
+            self.trial_running = True
+            return True
+
+    def record(self, ok: bool):
+        with self.lock:
+            if self.state == "half_open":
+                self.trial_running = False
+                if ok:
+                    self.state = "closed"
+                    self.results.clear()
+                else:
+                    self.state = "open"
+                    self.opened_at = time.monotonic()
+                return
+
+            self.results.append(ok)
+            failures = self.results.count(False)
+            if len(self.results) >= self.min_calls and failures / len(self.results) >= self.failure_rate:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def retry_in(self) -> float:
+        with self.lock:
+            return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(url: str) -> CircuitBreaker:
+    with _breakers_lock:
+        b = _breakers.get(url)
+        if b is None:
+            b = _breakers[url] = CircuitBreaker()
+        return b
+
+
+class ResponseTooLarge(ValueError):
+    """La respuesta pasa de FETCH_MAX_BYTES (comprimida o ya descomprimida)."""
 
-        # ✅ Permitir o no secuencias
-        if not allow_sequences:
-            if has_run_of_three_or_more(comb_list):
+
+class HTTPTransport:
+    """
+    GET con conexiones persistentes reutilizables por (esquema, host, puerto):
+    - un handshake TLS por conexión, no por descarga; hasta `per_host` conexiones ociosas por host.
+    - pide gzip/deflate y descomprime en streaming, cortando en `max_bytes`.
+    - sigue redirecciones (Sheets publica con 307 hacia googleusercontent.com).
+    - contabiliza bytes (red y texto), tiempo y conexiones nuevas vs reutilizadas.
+    Los errores HTTP se levantan como urllib.error.HTTPError, igual que con urlopen.
+    """
+
+    def __init__(self, per_host=HTTP_POOL_PER_HOST, idle_seconds=HTTP_IDLE_SECONDS,
+                 max_bytes=FETCH_MAX_BYTES, max_redirects=HTTP_MAX_REDIRECTS):
+        self.per_host = per_host
+        self.idle_seconds = idle_seconds
+        self.max_bytes = max_bytes
+        self.max_redirects = max_redirects
+        self.idle = {}      # (esquema, host, puerto) -> [(conexión, ociosa_desde), ...]
+        self.totals = {}    # host -> acumulados
+        self.recent = deque(maxlen=50)
+        self.lock = threading.Lock()
+
+    def reset(self):
+        """Descarta las conexiones ociosas (p. ej. tras un fork: el socket no se comparte)."""
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+    def _checkout(self, key, timeout):
+        now = time.monotonic()
+        with self.lock:
+            conns = self.idle.get(key, [])
+            while conns:
+                conn, since = conns.pop()
+                if now - since < self.idle_seconds:
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    conn.timeout = timeout
+                    return conn, True
+                conn.close()
+        return self._connect(key, timeout), False
+
+    @staticmethod
+    def _connect(key, timeout):
+        scheme, host, port = key
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(host, port, timeout=timeout)
+
+    def _checkin(self, key, conn):
+        with self.lock:
+            conns = self.idle.setdefault(key, [])
+            if len(conns) < self.per_host:
+                conns.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def _account(self, record):
+        with self.lock:
+            t = self.totals.setdefault(record["host"], {
+                "requests": 0, "connections": 0, "wire_bytes": 0, "bytes": 0, "seconds": 0.0,
+            })
+            t["requests"] += 1
+            t["connections"] += 0 if record["reused"] else 1
+            t["wire_bytes"] += record["wire_bytes"]
+            t["bytes"] += record["bytes"]
+            t["seconds"] += record["seconds"]
+            self.recent.append(record)
+
+    def _read_body(self, resp) -> tuple:
+        """(cuerpo descomprimido, bytes recibidos por la red)."""
+        encoding = (resp.getheader("Content-Encoding") or "").strip().lower()
+        if encoding == "gzip":
+            dec = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            dec = zlib.decompressobj()
+        else:
+            dec = None
+        length = resp.getheader("Content-Length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            raise ResponseTooLarge(f"Respuesta de {int(length)} bytes (máx. {self.max_bytes})")
+
+        out = bytearray()
+        wire = 0
+        while True:
+            chunk = resp.read(64 * 1024)
+            if not chunk:
+                break
+            wire += len(chunk)
+            if dec is not None:
+                try:
+                    chunk = dec.decompress(chunk, self.max_bytes - len(out) + 1)
+                except zlib.error:
+                    if encoding != "deflate" or wire != len(chunk) or out:
+                        raise
+                    # algunos servidores mandan "deflate" sin cabecera zlib
+                    dec = zlib.decompressobj(-zlib.MAX_WBITS)
+                    chunk = dec.decompress(chunk, self.max_bytes - len(out) + 1)
+                if dec.unconsumed_tail:
+                    raise ResponseTooLarge(f"Respuesta de más de {self.max_bytes} bytes")
+            out += chunk
+            if len(out) > self.max_bytes or wire > self.max_bytes:
+                raise ResponseTooLarge(f"Respuesta de más de {self.max_bytes} bytes")
+        if dec is not None:
+            out += dec.flush()
+        return bytes(out), wire
+
+    def _request_once(self, url: str, headers, timeout: float):
+        """Un GET sin seguir redirecciones: (status, headers, cuerpo, registro)."""
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"URL no soportada: {url}")
+        key = (scheme, parts.hostname, parts.port or (443 if scheme == "https" else 80))
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        hdrs = {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+        hdrs.update(headers or {})
+
+        started = time.perf_counter()
+        conn, reused = self._checkout(key, timeout)
+        try:
+            try:
+                conn.request("GET", path, headers=hdrs)
+                resp = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                # la conexión ociosa ya estaba cerrada del otro lado: una vez más con una nueva
+                conn.close()
+                conn, reused = self._connect(key, timeout), False
+                conn.request("GET", path, headers=hdrs)
+                resp = conn.getresponse()
+            body, wire = self._read_body(resp)
+        except BaseException:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self._checkin(key, conn)
+
+        record = {
+            "url": url, "host": parts.hostname, "status": resp.status, "reused": reused,
+            "encoding": resp.getheader("Content-Encoding") or "identity",
+            "wire_bytes": wire, "bytes": len(body),
+            "seconds": round(time.perf_counter() - started, 4),
+            "at": datetime.now().isoformat(timespec="seconds"),
+        }
+        self._account(record)
+        return resp.status, resp.headers, body
+
+    def get(self, url: str, headers=None, timeout: float = FETCH_TIMEOUT) -> bytes:
+        """Cuerpo (descomprimido) de un GET 2xx siguiendo redirecciones."""
+        for _ in range(self.max_redirects + 1):
+            status, resp_headers, body = self._request_once(url, headers, timeout)
+            if status in (301, 302, 303, 307, 308) and resp_headers.get("Location"):
+                url = urljoin(url, resp_headers["Location"])
                 continue
+            if status >= 400:
+                raise urllib.error.HTTPError(url, status, http.client.responses.get(status, ""),
+                                             resp_headers, None)
+            return body
+        raise urllib.error.URLError(f"Demasiadas redirecciones ({self.max_redirects})")
 
-        if max(comb_list) <= 31:
-            continue
+    def report(self):
+        with self.lock:
+            return {"hosts": {h: dict(t) for h, t in self.totals.items()},
+                    "idle": {f"{k[0]}://{k[1]}:{k[2]}": len(v) for k, v in self.idle.items()},
+                    "recent": list(self.recent)}
 
-        s = sum(comb_list)
-        if s < 50 or s > 150:
-            continue
 
-        return comb_list
+_transport = HTTPTransport()
+os.register_at_fork(after_in_child=_transport.reset)
 
 
-# ---------- Google Sheets CSV helpers ----------
+def request_deadline():
+    """Deadline (time.monotonic) del request actual, o None fuera de un request."""
+    if has_request_context():
+        return g.get("deadline")
+    return None
+
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, urllib.error.HTTPError):
+        return e.code == 429 or e.code >= 500
+    return isinstance(e, (urllib.error.URLError, TimeoutError, ConnectionError, http.client.HTTPException))
 
-def fetch_csv_rows(url: str, timeout=10):
-    """Descarga CSV y devuelve lista de dicts (usa header)."""
-    req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        data = resp.read().decode("utf-8", errors="replace")
 
-    reader = csv.DictReader(io.StringIO(data))
-    return list(reader)
+def fetch_csv_text(url: str, timeout=None, deadline=None) -> str:
+    """
+    Descarga el CSV como texto.
+    - Reintentos acotados (FETCH_RETRIES) con backoff + jitter.
+    - Nunca pasa del deadline (el del request actual si no se indica otro).
+    - Si el breaker de esa URL está abierto, falla de inmediato con CircuitOpenError.
+    """
+    timeout = timeout or FETCH_TIMEOUT
+    if deadline is None:
+        deadline = request_deadline() or (time.monotonic() + timeout * (FETCH_RETRIES + 1))
+
+    breaker = breaker_for(url)
+    # una sola consulta al breaker por llamada (en half_open, la llamada completa es la prueba)
+    if not breaker.allow():
+        raise CircuitOpenError(f"Sheets no responde; reintento en {breaker.retry_in():.0f}s")
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            breaker.record(False)
+            raise TimeoutError("Se agotó el tiempo para descargar el CSV")
+
+        try:
+            body = _transport.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=min(timeout, remaining))
+            data = body.decode("utf-8", errors="replace")
+        except Exception as e:
+            # el breaker cuenta descargas, no intentos: un fallo por llamada, cuando ya no se reintenta
+            if attempt >= FETCH_RETRIES or not _is_retryable(e):
+                breaker.record(False)
+                raise
+            # backoff exponencial con jitter completo, sin pasar del deadline
+            pause = random.uniform(0, 0.25 * (2 ** attempt))
+            if time.monotonic() + pause >= deadline:
+                breaker.record(False)
+                raise
+            time.sleep(pause)
+            attempt += 1
+            continue
+
+        breaker.record(True)
+        return data
 
 
 def safe_int(x):
@@ -201,6 +670,576 @@ def safe_int(x):
         return None
 
 
+# ---------- Tablas compactas (fecha ordinal + números empaquetados) ----------
+
+# Cada fila se guarda como 2 enteros: la fecha como ordinal (0 = sin fecha)
+# y los números como máscara de bits (bit n encendido = salió/jugó el n).
+SOURCE_KINDS = {
+    "sorteos": {"date_keys": ["fecha_iso", "fecha", "FECHA", "SORTEOID"],
+                "num_keys": ["N1", "N2", "N3", "N4", "N5"]},
+    "jugadas": {"date_keys": ["FECHA", "fecha", "fecha_iso"],
+                "num_keys": ["J1", "J2", "J3", "J4", "J5"]},
+}
+
+
+def mask_of(nums) -> int:
+    m = 0
+    for n in nums:
+        m |= 1 << n
+    return m
+
+
+def nums_of(mask: int):
+    """Máscara -> lista ordenada de números."""
+    return [n for n in range(1, MAX_NUMBER + 1) if mask >> n & 1]
+
+
+class DrawTable:
+    """
+    Filas de SORTEOS o JUGADAS en dos columnas array (12 bytes por fila),
+    ordenadas por fecha (las filas sin fecha, ordinal 0, quedan al principio).
+    """
+
+    __slots__ = ("ordinals", "masks")
+
+    def __init__(self):
+        self.ordinals = array("i")
+        self.masks = array("Q")
+
+    @classmethod
+    def from_rows(cls, rows):
+        """rows = [(ordinal, máscara), ...]; el orden original se respeta dentro de cada fecha."""
+        table = cls()
+        for o, m in sorted(rows, key=lambda x: x[0]):
+            table.ordinals.append(o)
+            table.masks.append(m)
+        return table
+
+    def __len__(self):
+        return len(self.masks)
+
+    def nbytes(self) -> int:
+        return (len(self.ordinals) * self.ordinals.itemsize
+                + len(self.masks) * self.masks.itemsize)
+
+    def version(self) -> str:
+        """Huella del contenido: si Sheets devuelve lo mismo, la versión no cambia."""
+        h = hashlib.sha1(self.ordinals.tobytes())
+        h.update(self.masks.tobytes())
+        return h.hexdigest()[:16]
+
+    def valid_rows(self):
+        """(ordinal, máscara) de filas con fecha y 5 números distintos, en orden de fecha."""
+        return [(o, m) for o, m in zip(self.ordinals, self.masks)
+                if o and m.bit_count() == NUM_NUMBERS]
+
+    def last_valid(self, n: int):
+        """Las últimas n filas válidas (en orden de fecha) sin recorrer toda la tabla."""
+        out = []
+        i = len(self.masks) - 1
+        while i >= 0 and len(out) < n and self.ordinals[i]:
+            if self.masks[i].bit_count() == NUM_NUMBERS:
+                out.append((self.ordinals[i], self.masks[i]))
+            i -= 1
+        out.reverse()
+        return out
+
+    def rows_on(self, ordinal: int):
+        """Máscaras válidas de una fecha (búsqueda binaria)."""
+        lo = bisect_left(self.ordinals, ordinal)
+        hi = bisect_right(self.ordinals, ordinal, lo)
+        return [m for m in self.masks[lo:hi] if m.bit_count() == NUM_NUMBERS]
+
+    def find(self, ordinal: int):
+        """Máscara del sorteo de esa fecha (la última si hay varias) o None."""
+        rows = self.rows_on(ordinal)
+        return rows[-1] if rows else None
+
+    def with_rows(self, rows):
+        """Copia de la tabla con filas nuevas insertadas en su fecha (no muta la original)."""
+        table = DrawTable()
+        table.ordinals = array("i", self.ordinals)
+        table.masks = array("Q", self.masks)
+        for o, m in rows:
+            i = bisect_right(table.ordinals, o)
+            table.ordinals.insert(i, o)
+            table.masks.insert(i, m)
+        return table
+
+
+def parse_table(text: str, kind: str) -> DrawTable:
+    """Parsea el CSV directo a DrawTable, sin crear un dict por fila."""
+    cols = SOURCE_KINDS[kind]
+    reader = csv.reader(io.StringIO(text))
+    header = next(reader, [])
+    pos = {name: i for i, name in enumerate(header)}
+    date_idx = [pos[k] for k in cols["date_keys"] if k in pos]
+    num_idx = [pos[k] for k in cols["num_keys"] if k in pos]
+
+    rows = []
+    for row in reader:
+        raw_date = next((row[i] for i in date_idx if i < len(row) and row[i]), None)
+        nums = []
+        for i in num_idx:
+            n = safe_int(row[i]) if i < len(row) else None
+            if n and 1 <= n <= MAX_NUMBER:
+                nums.append(n)
+        d = parse_date_flexible(raw_date)
+        rows.append((d.toordinal() if d else 0, mask_of(nums)))
+    return DrawTable.from_rows(rows)
+
+
+def measure_memory(rows: int = 10000, seed: int = 1):
+    """
+    Compara memoria (tracemalloc) de `rows` filas como lista de dicts de DictReader
+    contra DrawTable. Devuelve (bytes_dicts, bytes_tabla).
+    """
+    rnd = random.Random(seed)
+    lines = ["fecha_iso,N1,N2,N3,N4,N5"]
+    d = date(2000, 1, 1)
+    for i in range(rows):
+        lines.append(f"{(d + timedelta(days=i)).isoformat()}," + ",".join(
+            str(n) for n in rnd.sample(range(1, MAX_NUMBER + 1), NUM_NUMBERS)))
+    text = "\n".join(lines) + "\n"
+
+    def traced(build):
+        tracemalloc.start()
+        obj = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del obj
+        return size
+
+    as_dicts = traced(lambda: list(csv.DictReader(io.StringIO(text))))
+    as_table = traced(lambda: parse_table(text, "sorteos"))
+    return as_dicts, as_table
+
+
+# ---------- Registro de grupos (tenants) y fuentes ----------
+
+def load_tenant_registry(config: str = None):
+    """
+    Lee MILOTO_TENANTS (ruta a JSON o JSON directo):
+    {
+      "sources": {"sorteos": "https://...", "jugadas-a": "https://..."},
+      "tenants": {"grupo-a": {"name": "Grupo A", "sorteos": "sorteos", "jugadas": "jugadas-a"}},
+      "default": "grupo-a",
+      "allow_custom_csv": false
+    }
+    Las fuentes se nombran una sola vez; varios grupos pueden compartir la misma.
+    """
+    config = TENANTS_CONFIG if config is None else config
+    if not config.strip():
+        return {"sources": {}, "tenants": {}, "default": None, "allow_custom_csv": True}
+
+    if config.lstrip().startswith("{"):
+        data = json.loads(config)
+    else:
+        with open(config, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+    sources = {name: str(url).strip() for name, url in data.get("sources", {}).items()}
+    tenants = {}
+    for tid, t in data.get("tenants", {}).items():
+        for kind in ("sorteos", "jugadas"):
+            if t.get(kind) not in sources:
+                raise ValueError(f"Tenant {tid!r}: fuente {kind} desconocida: {t.get(kind)!r}")
+        tenants[tid] = {"name": t.get("name", tid),
+                        "sorteos": sources[t["sorteos"]],
+                        "jugadas": sources[t["jugadas"]]}
+    default = data.get("default") or (next(iter(tenants)) if tenants else None)
+    if default is not None and default not in tenants:
+        raise ValueError(f"Tenant por defecto desconocido: {default!r}")
+    return {"sources": sources, "tenants": tenants, "default": default,
+            "allow_custom_csv": bool(data.get("allow_custom_csv", not tenants))}
+
+
+REGISTRY = load_tenant_registry()
+
+
+def resolve_sources(tenant_id: str, sorteos_param: str, jugadas_param: str):
+    """
+    Decide qué CSV usar para este request.
+    Retorna (tenant_id|None, sorteos_url, jugadas_url, error|None).
+    """
+    tenants = REGISTRY["tenants"]
+    error = None
+    tenant = None
+    if tenant_id:
+        if tenant_id in tenants:
+            tenant = tenant_id
+        else:
+            error = f"Grupo desconocido: {tenant_id}"
+    if tenant is None:
+        tenant = REGISTRY["default"]
+
+    if tenant:
+        sorteos_url = tenants[tenant]["sorteos"]
+        jugadas_url = tenants[tenant]["jugadas"]
+    else:
+        sorteos_url, jugadas_url = DEFAULT_SORTEOS_CSV, DEFAULT_JUGADAS_CSV
+
+    if REGISTRY["allow_custom_csv"]:
+        sorteos_url = sorteos_param or sorteos_url
+        jugadas_url = jugadas_param or jugadas_url
+    return tenant, sorteos_url, jugadas_url, error
+
+
+# ---------- Cache de datos + snapshot en disco ----------
+
+class BoundedLRU:
+    """
+    Cache LRU con presupuesto en bytes (estimados con `sizeof`).
+    Al pasar del presupuesto se descartan las entradas menos usadas.
+    No es thread-safe por sí sola: se usa bajo _data_lock.
+    """
+
+    def __init__(self, max_bytes: int, sizeof):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._items = OrderedDict()   # key -> (value, size)
+        self.total_bytes = 0
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        hit = self._items.get(key)
+        if hit is None:
+            return default
+        self._items.move_to_end(key)
+        return hit[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.total_bytes -= old[1]
+        self._items[key] = (value, size)
+        self.total_bytes += size
+        # siempre se conserva al menos la entrada recién puesta
+        while self.total_bytes > self.max_bytes and len(self._items) > 1:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self.total_bytes -= evicted
+
+    def items(self):
+        return [(k, v) for k, (v, _) in self._items.items()]
+
+    def clear(self):
+        self._items.clear()
+        self.total_bytes = 0
+
+
+def _dataset_size(entry) -> int:
+    return entry["table"].nbytes() + 512
+
+
+def _derived_size(item) -> int:
+    # aproximado: el pickle es más chico que los objetos vivos, x3 como margen
+    return 3 * len(pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+SNAPSHOT_FORMAT = 3
+
+_data_lock = threading.Lock()
+# (kind, url) -> {"table": DrawTable, "counts": [...], "fetched_at": datetime, "version": str}
+# la clave es la URL: grupos que comparten SORTEOS comparten la misma entrada
+_datasets = BoundedLRU(DATA_BUDGET_BYTES, _dataset_size)
+_derived = BoundedLRU(DERIVED_BUDGET_BYTES, _derived_size)   # (name, sources, params) -> (versions, value)
+_refreshing = set()
+_inflight = {}     # (kind, url) -> Future de la descarga en curso
+_io_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="miloto-io")
+_snapshot_pending = False
+
+# Filas recibidas por /api/ingest que quizá aún no están en el Sheet: (kind, url) -> [(ordinal, máscara)]
+_local_history = {}
+
+
+def count_numbers(masks):
+    """Cuántas veces aparece cada número (índice 1..MAX_NUMBER) en las máscaras."""
+    counts = [0] * (MAX_NUMBER + 1)
+    for m in masks:
+        while m:
+            low = m & -m
+            counts[low.bit_length() - 1] += 1
+            m ^= low
+    return counts
+
+
+def _make_entry(table: DrawTable, fetched_at: datetime):
+    return {"table": table, "counts": count_numbers(table.masks),
+            "fetched_at": fetched_at, "version": table.version()}
+
+
+def _missing_local_rows(table: DrawTable, kind: str, url: str):
+    """Filas del historial local que la tabla todavía no trae."""
+    pending = _local_history.get((kind, url))
+    if not pending:
+        return []
+    missing = []
+    if kind == "sorteos":
+        missing = [(o, m) for o, m in pending if table.find(o) is None]
+    else:
+        # multiconjunto por fecha: una jugada repetida cuenta las veces que se ingresó
+        used = {}
+        for o, m in pending:
+            present = table.rows_on(o).count(m)
+            seen = used.get((o, m), 0)
+            if seen >= present:
+                missing.append((o, m))
+            used[(o, m)] = seen + 1
+    return missing
+
+
+def _merge_local_history(table: DrawTable, kind: str, url: str) -> DrawTable:
+    """Suma las filas ingresadas localmente que el Sheet todavía no trae."""
+    missing = _missing_local_rows(table, kind, url)
+    return table.with_rows(missing) if missing else table
+
+
+def refresh_dataset(url: str, kind: str, deadline=None):
+    """Descarga la fuente, la guarda en memoria y agenda el snapshot."""
+    table = parse_table(fetch_csv_text(url, deadline=deadline), kind)
+    # merge + put bajo el lock de ingesta: una ingesta en medio no se pierde al reemplazar la entrada
+    with _ingest_lock:
+        sync_local_history()
+        table = _merge_local_history(table, kind, url)
+        entry = _make_entry(table, datetime.now())
+        with _data_lock:
+            old = _datasets.get((kind, url))
+        if old is not None and old.get("decay"):
+            entry["decay"] = carry_decay_states(old, entry)
+        with _data_lock:
+            _datasets.put((kind, url), entry)
+    schedule_snapshot_save()
+    return entry
+
+
+def _refresh_in_background(url: str, kind: str):
+    key = (kind, url)
+    with _data_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            refresh_dataset(url, kind)
+        except Exception as e:
+            app.logger.warning("No pude refrescar %s: %s", url, e)
+        finally:
+            with _data_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def get_dataset(url: str, kind: str):
+    """
+    Devuelve la entrada en memoria de una fuente.
+    - Sin datos: descarga ya (bloquea).
+    - Datos viejos (> TTL): se sirven igual y se refrescan en segundo plano.
+    Antes mira si otro proceso agregó filas al historial local (un stat si no hay nada nuevo).
+    Si la descarga ya falló en este request (ej: en prefetch_sources) se repite el error, no la descarga.
+    """
+    sync_local_history()
+    with _data_lock:
+        entry = _datasets.get((kind, url))
+    if entry is None:
+        errors = _request_fetch_errors()
+        if errors is not None and (kind, url) in errors:
+            raise errors[(kind, url)]
+        try:
+            return _fetch_single_flight(url, kind, request_deadline())
+        except Exception as e:
+            if errors is not None:
+                errors[(kind, url)] = e
+            raise
+    age = (datetime.now() - entry["fetched_at"]).total_seconds()
+    if age > DATA_TTL_SECONDS:
+        _refresh_in_background(url, kind)
+    return entry
+
+
+def _request_fetch_errors():
+    """Descargas que ya fallaron en este request: (kind, url) -> excepción. None fuera de un request."""
+    if not has_request_context():
+        return None
+    if "fetch_errors" not in g:
+        g.fetch_errors = {}
+    return g.fetch_errors
+
+
+def _fetch_single_flight(url: str, kind: str, deadline=None):
+    """
+    Descarga bloqueante con una sola descarga en vuelo por fuente:
+    si otro hilo ya la está bajando, se espera su resultado en vez de repetirla.
+    """
+    key = (kind, url)
+    with _data_lock:
+        entry = _datasets.get(key)
+        if entry is not None:
+            return entry
+        fut = _inflight.get(key)
+        owner = fut is None
+        if owner:
+            fut = _inflight[key] = Future()
+    if not owner:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        return fut.result(timeout=timeout)
+
+    try:
+        entry = refresh_dataset(url, kind, deadline=deadline)
+        fut.set_result(entry)
+        return entry
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    finally:
+        with _data_lock:
+            _inflight.pop(key, None)
+
+
+def prefetch_sources(sources):
+    """
+    Descarga en paralelo las fuentes que faltan (ej: SORTEOS y JUGADAS en frío),
+    así el request espera la más lenta y no la suma. Los errores quedan anotados en el request
+    y get_dataset los repite sin volver a descargar.
+    """
+    with _data_lock:
+        missing = [(k, u) for k, u in dict.fromkeys(sources) if (k, u) not in _datasets]
+    if len(missing) < 2:
+        return
+    deadline = request_deadline()
+    errors = _request_fetch_errors()
+    if errors is None:
+        errors = {}
+    if has_request_context() and g.get("profiler") is not None:
+        # cProfile solo mide este hilo: perfilando, descargamos aquí mismo
+        for k, u in missing:
+            try:
+                _fetch_single_flight(u, k, deadline)
+            except Exception as e:
+                errors[(k, u)] = e
+        return
+    futures = {_io_pool.submit(_fetch_single_flight, u, k, deadline): (k, u) for k, u in missing}
+    wait(futures, timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+    for fut, key in futures.items():
+        # las que siguen en vuelo (deadline) se esperan en get_dataset
+        if fut.done() and fut.exception() is not None:
+            errors[key] = fut.exception()
+
+
+def get_table(url: str, kind: str) -> DrawTable:
+    """Tabla compacta de la fuente, pasando por la cache/snapshot."""
+    return get_dataset(url, kind)["table"]
+
+
+def derived(name: str, sources, params, compute):
+    """
+    Memoiza un cálculo derivado (hot, resumen...) por versión de datos.
+    `sources` = [(kind, url), ...]; si alguna cambió de versión, se recalcula.
+    """
+    sources = tuple(sources)
+    versions = tuple(get_dataset(url, kind)["version"] for kind, url in sources)
+    key = (name, sources, tuple(params))
+    with _data_lock:
+        hit = _derived.get(key)
+    if hit and hit[0] == versions:
+        return hit[1]
+    value = compute()
+    with _data_lock:
+        _derived.put(key, (versions, value))
+    schedule_snapshot_save()
+    return value
+
+
+def data_as_of(sources):
+    """Fecha de descarga más antigua entre las fuentes usadas (o None)."""
+    with _data_lock:
+        stamps = [_datasets.get((k, u))["fetched_at"] for k, u in sources if (k, u) in _datasets]
+    return min(stamps) if stamps else None
+
+
+def save_snapshot(path: str = None):
+    """Escribe datasets + derivados a disco (gzip+pickle, reemplazo atómico)."""
+    path = path or SNAPSHOT_PATH
+    # se serializa bajo el lock: las entradas (p. ej. "decay") se mutan en el lugar
+    with _data_lock:
+        raw = pickle.dumps({
+            "format": SNAPSHOT_FORMAT,
+            "saved_at": datetime.now(),
+            "datasets": dict(_datasets.items()),
+            "derived": dict(_derived.items()),
+        }, protocol=pickle.HIGHEST_PROTOCOL)
+    data = gzip.compress(raw, compresslevel=6)
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, mode=0o700, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix=".miloto_snapshot.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def load_snapshot(path: str = None) -> bool:
+    """Carga el snapshot si existe. Devuelve True si cargó algo."""
+    path = path or SNAPSHOT_PATH
+    try:
+        with open(path, "rb") as f:
+            # pickle ejecuta código: solo se acepta un archivo nuestro que nadie más pueda escribir
+            st = os.fstat(f.fileno())
+            if (hasattr(os, "getuid") and st.st_uid != os.getuid()) or st.st_mode & 0o022:
+                app.logger.warning("Snapshot con dueño o permisos inseguros (%s), se ignora", path)
+                return False
+            payload = pickle.loads(gzip.decompress(f.read()))
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        app.logger.warning("Snapshot ilegible (%s), se ignora: %s", path, e)
+        return False
+    if payload.get("format") != SNAPSHOT_FORMAT:
+        return False
+    with _data_lock:
+        for key, entry in payload.get("datasets", {}).items():
+            if key not in _datasets:
+                if key in _local_history:
+                    entry = _make_entry(_merge_local_history(entry["table"], *key), entry["fetched_at"])
+                _datasets.put(key, entry)
+        for key, value in payload.get("derived", {}).items():
+            if key not in _derived:
+                _derived.put(key, value)
+    return True
+
+
+def schedule_snapshot_save(delay: float = 1.0):
+    """Agrupa varios cambios seguidos en una sola escritura del snapshot."""
+    global _snapshot_pending
+    with _data_lock:
+        if _snapshot_pending or not SNAPSHOT_PATH:
+            return
+        _snapshot_pending = True
+
+    def run():
+        global _snapshot_pending
+        threading.Event().wait(delay)
+        with _data_lock:
+            _snapshot_pending = False
+        try:
+            save_snapshot()
+        except Exception as e:
+            app.logger.warning("No pude guardar snapshot: %s", e)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
 def compute_hot_from_history(sorteos_url: str, jugadas_url: str, top_n: int = 6, min_played: int = 1):
     """
     Opción C:
@@ -209,22 +1248,9 @@ def compute_hot_from_history(sorteos_url: str, jugadas_url: str, top_n: int = 6,
     - ratio = freq / played (si played>0)
     - score suavizado = (freq+1)/(played+2) para evitar trampas por muestras pequeñas
     """
-    freq = {n: 0 for n in range(1, MAX_NUMBER + 1)}
-    played = {n: 0 for n in range(1, MAX_NUMBER + 1)}
-
-    sorteos_rows = fetch_csv_rows(sorteos_url)
-    for r in sorteos_rows:
-        for k in ["N1", "N2", "N3", "N4", "N5"]:
-            n = safe_int(r.get(k, ""))
-            if n and 1 <= n <= MAX_NUMBER:
-                freq[n] += 1
-
-    jugadas_rows = fetch_csv_rows(jugadas_url)
-    for r in jugadas_rows:
-        for k in ["J1", "J2", "J3", "J4", "J5"]:
-            n = safe_int(r.get(k, ""))
-            if n and 1 <= n <= MAX_NUMBER:
-                played[n] += 1
+    # conteos mantenidos por la cache (y actualizados al ingresar filas): O(39)
+    freq = get_dataset(sorteos_url, "sorteos")["counts"]
+    played = get_dataset(jugadas_url, "jugadas")["counts"]
 
     stats = []
     for n in range(1, MAX_NUMBER + 1):
@@ -296,50 +1322,21 @@ def classify_hits(hits: int):
 
 # ---------- NUEVO: Hot actuales + Resumen + Cruce Jugadas vs Sorteos ----------
 
-def build_sorteos_map(sorteos_url: str):
-    """
-    Lee EXPORT_SORTEOS y retorna:
-    - mapa: {date: set(nums)}
-    - lista_ordenada: [(date, [n1..n5]), ...] orden ascendente
-    """
-    rows = fetch_csv_rows(sorteos_url)
-    out = []
-    for r in rows:
-        d = parse_date_flexible(r.get("fecha_iso") or r.get("fecha") or r.get("FECHA") or r.get("SORTEOID"))
-        if not d:
-            continue
-        nums = []
-        for k in ["N1", "N2", "N3", "N4", "N5"]:
-            n = safe_int(r.get(k, ""))
-            if n and 1 <= n <= MAX_NUMBER:
-                nums.append(n)
-        if len(nums) == 5 and len(set(nums)) == 5:
-            out.append((d, nums))
-
-    out.sort(key=lambda x: x[0])
-    mapa = {d: set(nums) for d, nums in out}
-    return mapa, out
-
-
 def compute_current_hot(sorteos_url: str, last_n_draws: int = 20, top_k: int = 6):
     """
     Hot actuales = frecuencia en los últimos N sorteos.
     Retorna (hot_list, preview_table, from_date, to_date)
     """
-    _, sorteos_list = build_sorteos_map(sorteos_url)
-    recent = sorteos_list[-last_n_draws:] if last_n_draws > 0 else sorteos_list[:]
-    freq = {n: 0 for n in range(1, MAX_NUMBER + 1)}
-
-    for _, nums in recent:
-        for n in nums:
-            freq[n] += 1
+    sorteos = get_table(sorteos_url, "sorteos")
+    recent = sorteos.last_valid(last_n_draws) if last_n_draws > 0 else sorteos.valid_rows()
+    freq = count_numbers(m for _, m in recent)
 
     table = [{"n": n, "freq_recent": freq[n]} for n in range(1, MAX_NUMBER + 1)]
     table.sort(key=lambda x: x["freq_recent"], reverse=True)
 
     hot_list = [x["n"] for x in table[:top_k]]
-    from_date = recent[0][0] if recent else None
-    to_date = recent[-1][0] if recent else None
+    from_date = date.fromordinal(recent[0][0]) if recent else None
+    to_date = date.fromordinal(recent[-1][0]) if recent else None
 
     return hot_list, table[:max(top_k, 12)], from_date, to_date
 
@@ -349,246 +1346,1048 @@ def compute_jugadas_stats(sorteos_url: str, jugadas_url: str, limit_recent: int
     Cruza JUGADAS vs SORTEOS por fecha y calcula aciertos.
     Retorna summary + recent_rows.
     """
-    sorteos_map, sorteos_list = build_sorteos_map(sorteos_url)
-    jugadas_rows = fetch_csv_rows(jugadas_url)
-
-    dist = {i: 0 for i in range(0, 6)}
-    total = 0
-    tickets = 0
-    premios = 0
-
-    computed_rows = []
-
-    for r in jugadas_rows:
-        d = parse_date_flexible(r.get("FECHA") or r.get("fecha") or r.get("fecha_iso"))
-        if not d:
-            continue
-
-        nums = []
-        for k in ["J1", "J2", "J3", "J4", "J5"]:
-            n = safe_int(r.get(k, ""))
-            if n and 1 <= n <= MAX_NUMBER:
-                nums.append(n)
-
-        if len(nums) != 5 or len(set(nums)) != 5:
-            continue
-
-        draw_set = sorteos_map.get(d)
-        if not draw_set:
+    sorteos = get_table(sorteos_url, "sorteos")
+    jugadas = get_table(jugadas_url, "jugadas")
+    agg = hits_summary(sorteos_url, jugadas_url)
+
+    # solo las filas que se muestran se convierten a dicts
+    recent_rows = []
+    shown = jugadas.last_valid(limit_recent) if limit_recent > 0 else jugadas.valid_rows()
+    for o, m in shown:
+        draw_mask = sorteos.find(o)
+        if draw_mask is None:
             hits = None
             msg = "⏳ Sin sorteo en tu Sheet"
         else:
-            hits = len(set(nums) & draw_set)
+            hits = (m & draw_mask).bit_count()
             msg = classify_hits(hits)
-
-            total += 1
-            dist[hits] += 1
-            if hits == 2:
-                tickets += 1
-            if hits >= 3:
-                premios += 1
-
-        computed_rows.append({
-            "date": d,
-            "combo": nums,
+        recent_rows.append({
+            "date": date.fromordinal(o),
+            "combo": nums_of(m),
             "hits": hits,
             "msg": msg
         })
 
-    computed_rows.sort(key=lambda x: x["date"])
-    recent_rows = computed_rows[-limit_recent:] if limit_recent > 0 else computed_rows
-
+    last_draw = sorteos.last_valid(1)
     summary = {
-        "total": total,
-        "dist": dist,
-        "tickets": tickets,
-        "premios": premios,
-        "last_draw_date": sorteos_list[-1][0] if sorteos_list else None
+        "total": agg["total"],
+        "dist": dict(agg["dist"]),
+        "tickets": agg["tickets"],
+        "premios": agg["premios"],
+        "last_draw_date": date.fromordinal(last_draw[0][0]) if last_draw else None
     }
     return summary, recent_rows
 
 
-@app.route("/", methods=["GET"])
-def index():
-    # UI params
-    hot_str = request.args.get("hot", "")
-    hot_count = request.args.get("hot_count", str(DEFAULT_HOT_COUNT))
+# ---------- Agregados de aciertos (incrementales) ----------
 
-    start_str = request.args.get("start", "")
-    start_date = parse_date_yyyy_mm_dd(start_str)
+# (sorteos_url, jugadas_url) -> {"versions", "dist", "total", "tickets", "premios"}
+_hits_aggs = BoundedLRU(256, lambda agg: 1)
 
-    # ✅ permitir secuencias
-    allow_seq = request.args.get("allow_seq", "0")  # 0=NO (estricto), 1=SI
-    allow_sequences = (allow_seq == "1")
 
-    # ✅ resultado del sorteo para verificar aciertos
-    draw_result_str = request.args.get("draw", "").strip()
-    draw_nums = parse_draw_result(draw_result_str)
+def _add_hits(agg, hits: int):
+    agg["total"] += 1
+    agg["dist"][hits] += 1
+    if hits == 2:
+        agg["tickets"] += 1
+    if hits >= 3:
+        agg["premios"] += 1
 
-    # ✅ NUEVO: cargar resumen estadístico desde Sheets
-    load_stats = request.args.get("stats", "0")  # 1=SI
-    stats_enabled = (load_stats == "1")
 
-    # Sheets params
-    sorteos_url = request.args.get("sorteos_csv", DEFAULT_SORTEOS_CSV).strip()
-    jugadas_url = request.args.get("jugadas_csv", DEFAULT_JUGADAS_CSV).strip()
-    top_n = request.args.get("topn", "6")
-    min_played = request.args.get("min_played", "1")
-    use_suggested = request.args.get("use_suggested", "0")
+def hits_summary(sorteos_url: str, jugadas_url: str):
+    """
+    Distribución de aciertos JUGADAS vs SORTEOS por fecha.
+    Se calcula completa una vez por versión de datos; las ingestas la actualizan en el lugar.
+    """
+    s_entry = get_dataset(sorteos_url, "sorteos")
+    j_entry = get_dataset(jugadas_url, "jugadas")
+    versions = (s_entry["version"], j_entry["version"])
+    key = (sorteos_url, jugadas_url)
+    with _data_lock:
+        agg = _hits_aggs.get(key)
+        if agg and agg["versions"] == versions:
+            return agg
+
+    agg = {"versions": versions, "dist": {i: 0 for i in range(0, 6)},
+           "total": 0, "tickets": 0, "premios": 0}
+    sorteos = s_entry["table"]
+    for o, m in j_entry["table"].valid_rows():
+        draw_mask = sorteos.find(o)
+        if draw_mask is not None:
+            _add_hits(agg, (m & draw_mask).bit_count())
+    with _data_lock:
+        _hits_aggs.put(key, agg)
+    return agg
+
+
+# ---------- Hot con decaimiento temporal (incremental) ----------
+
+def _decay_empty(half_life: int):
+    return {"half_life": half_life, "scores": [0.0] * (MAX_NUMBER + 1),
+            "weight": 0.0, "rows_seen": 0, "last_row": None, "prefix": ""}
+
+
+def _rows_digest(prev: str, rows) -> str:
+    """Huella encadenada de filas (o, m): si el Sheet corrige un sorteo viejo, la huella cambia."""
+    for o, m in rows:
+        prev = hashlib.sha1(f"{prev}{o}:{m};".encode()).hexdigest()[:16]
+    return prev
+
+
+def decay_advance(state, rows):
+    """
+    Aplica sorteos nuevos (en orden de fecha) a un estado de decaimiento: O(39) por sorteo.
+    score_n <- score_n * λ + [n salió], con λ = 0.5 ** (1 / vida_media).
+    Devuelve un estado nuevo (no muta el anterior: lo pueden estar leyendo otros hilos).
+    """
+    if not rows:
+        return state
+    lam = 0.5 ** (1.0 / state["half_life"])
+    scores = list(state["scores"])
+    weight = state["weight"]
+    for _, m in rows:
+        for n in range(1, MAX_NUMBER + 1):
+            scores[n] *= lam
+        for n in nums_of(m):
+            scores[n] += 1.0
+        weight = weight * lam + 1.0
+    return {"half_life": state["half_life"], "scores": scores, "weight": weight,
+            "rows_seen": state["rows_seen"] + len(rows), "last_row": rows[-1],
+            "prefix": _rows_digest(state.get("prefix", ""), rows)}
+
+
+def advance_decay_states(states, rows):
+    """Estados tras ingresar filas; los que no pueden avanzar (fecha en el medio) se descartan."""
+    valid = sorted(((o, m) for o, m in rows if o and m.bit_count() == NUM_NUMBERS), key=lambda x: x[0])
+    out = {}
+    for h, st in states.items():
+        if st["last_row"] is None or not valid or valid[0][0] >= st["last_row"][0]:
+            out[h] = decay_advance(st, valid)
+    return out
 
-    # parse ints
-    try:
-        hot_count_int = int(hot_count)
-    except:
-        hot_count_int = DEFAULT_HOT_COUNT
 
-    try:
-        top_n_int = max(3, min(int(top_n), 12))
-    except:
-        top_n_int = 6
+def carry_decay_states(old, new):
+    """
+    Tras refrescar del Sheet: si la tabla nueva extiende a la vieja, solo se aplican los sorteos nuevos.
+    Se compara la huella de las primeras `rows_seen` filas (no solo la última): si el Sheet corrigió
+    cualquier sorteo anterior, el estado se descarta y se recalcula completo al pedirlo.
+    """
+    if old["version"] == new["version"]:
+        return dict(old["decay"])
+    valid = new["table"].valid_rows()
+    needed = {st["rows_seen"] for st in old["decay"].values() if st["rows_seen"] <= len(valid)}
+    digests = {0: ""}
+    prefix = ""
+    for i, row in enumerate(valid[:max(needed, default=0)], 1):
+        prefix = _rows_digest(prefix, [row])
+        if i in needed:
+            digests[i] = prefix
+    out = {}
+    for h, st in old["decay"].items():
+        k = st["rows_seen"]
+        if k in digests and digests[k] == st.get("prefix"):
+            out[h] = decay_advance(st, valid[k:])
+    return out
 
-    try:
-        min_played_int = max(0, min(int(min_played), 50))
-    except:
-        min_played_int = 1
 
-    error = None
-    sheets_error = None
-    hot_stats_table = None
+def decay_state(entry, half_life: int):
+    """Estado de decaimiento de la fuente (se calcula completo solo la primera vez)."""
+    with _data_lock:
+        st = entry.get("decay", {}).get(half_life)
+    if st is None:
+        st = decay_advance(_decay_empty(half_life), entry["table"].valid_rows())
+        with _data_lock:
+            entry.setdefault("decay", {})[half_life] = st
+        schedule_snapshot_save()
+    return st
 
-    # Stats UI
-    stats_error = None
-    current_hot = None
-    current_hot_table = None
-    current_hot_range = None
-    jugadas_summary = None
-    jugadas_recent = None
 
-    if use_suggested == "1":
-        try:
-            suggested_hot, all_stats, top_table = compute_hot_from_history(
-                sorteos_url=sorteos_url,
-                jugadas_url=jugadas_url,
-                top_n=top_n_int,
-                min_played=min_played_int
-            )
-            hot_stats_table = top_table
-            hot_str = ", ".join(str(x) for x in suggested_hot)
-        except Exception as e:
-            sheets_error = f"No pude leer/parsear tus CSV: {e}"
+def compute_decayed_hot(sorteos_url: str, half_life: int = DEFAULT_HALF_LIFE, top_n: int = 6):
+    """
+    Hot con decaimiento exponencial: cada sorteo pesa la mitad cada `half_life` sorteos.
+    score = frecuencia decaída / peso total (≈ probabilidad reciente de salir; base 5/39).
+    Retorna (suggested, top_table).
+    """
+    st = decay_state(get_dataset(sorteos_url, "sorteos"), half_life)
+    weight = st["weight"] or 1.0
+    stats = [{"n": n, "decayed": st["scores"][n], "score": st["scores"][n] / weight}
+             for n in range(1, MAX_NUMBER + 1)]
+    stats.sort(key=lambda x: x["decayed"], reverse=True)
+    return [x["n"] for x in stats[:top_n]], stats[:max(top_n, 10)]
 
-    # ✅ cargar resumen si está activo
-    if stats_enabled:
-        try:
-            current_hot, current_hot_table, hot_from, hot_to = compute_current_hot(
-                sorteos_url=sorteos_url, last_n_draws=20, top_k=6
-            )
-            current_hot_range = (hot_from, hot_to)
 
-            jugadas_summary, jugadas_recent = compute_jugadas_stats(
-                sorteos_url=sorteos_url, jugadas_url=jugadas_url, limit_recent=20
-            )
-        except Exception as e:
-            stats_error = f"No pude calcular stats desde Sheets: {e}"
+# ---------- Ingesta de resultados y jugadas (push) ----------
 
-    try:
-        hot_numbers = parse_int_list(hot_str) if hot_str else DEFAULT_HOT
-    except Exception as e:
-        error = str(e)
-        hot_numbers = DEFAULT_HOT
+INGEST_TOKEN = os.environ.get("MILOTO_INGEST_TOKEN", "")
+LOCAL_HISTORY_PATH = os.environ.get("MILOTO_LOCAL_HISTORY", os.path.join(DATA_DIR, "local_history.jsonl"))
 
-    base = start_date or datetime.now().date()
-    start_monday = monday_of_week(base)
+# RLock: refresh_dataset y la ingesta lo toman y adentro sync_local_history lo vuelve a tomar
+_ingest_lock = threading.RLock()
+_local_history_state = {"id": None, "pos": 0}   # archivo (inodo) y bytes ya leídos
 
-    draw_dates = build_draw_dates(start_monday)
 
-    week1 = draw_dates[:4]
-    week2 = draw_dates[4:]
-    w1 = weekly_weights_for_dates(week1)
-    w2 = weekly_weights_for_dates(week2)
+class IngestConflict(ValueError):
+    """Ya hay un resultado distinto para esa fecha."""
 
-    day_plan = [(d, w1[d]) for d in week1] + [(d, w2[d]) for d in week2]
-    total_bets = sum(n for _, n in day_plan)
 
-    combos = []
-    seen = set()
-    while len(combos) < total_bets:
-        c = tuple(generate_combination(hot_numbers, hot_count_int, allow_sequences))
-        if c in seen:
-            continue
-        seen.add(c)
-        combos.append(list(c))
+def _apply_local_rows(kind: str, url: str):
+    """Aplica a la entrada en memoria (si está cargada) las filas locales que le falten."""
+    with _data_lock:
+        entry = _datasets.get((kind, url))
+    if entry is None:
+        return
+    missing = _missing_local_rows(entry["table"], kind, url)
+    if missing:
+        _apply_rows(kind, url, missing, old=entry)
 
-    calendar = []
-    idx = 0
-    for d, n in day_plan:
-        assigned = combos[idx: idx + n]
-        idx += n
-        calendar.append((d, n, assigned))
 
-    # ✅ Verificación de aciertos (si el usuario metió resultado)
-    verify_rows = None
-    draw_invalid = False
-    if draw_result_str:
-        if not draw_nums:
-            draw_invalid = True
+def sync_local_history(path: str = None):
+    """
+    Lee lo nuevo del historial local (JSON lines) y lo aplica a las fuentes cargadas.
+    El archivo es el punto de encuentro entre workers (y el CLI): cada proceso recuerda
+    hasta qué byte leyó, así una ingesta en un worker aparece en todos al siguiente request.
+    """
+    path = path or LOCAL_HISTORY_PATH
+    if not path:
+        return
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return
+    file_id = (st.st_dev, st.st_ino)
+    state = _local_history_state
+    if state["id"] == file_id and state["pos"] == st.st_size:
+        return
+
+    with _ingest_lock:
+        if state["id"] != file_id or st.st_size < state["pos"]:
+            # archivo nuevo o truncado: se relee desde el principio
+            _local_history.clear()
+            state["id"], state["pos"] = file_id, 0
+        if st.st_size <= state["pos"]:
+            return
+        with open(path, "rb") as f:
+            f.seek(state["pos"])
+            chunk = f.read(st.st_size - state["pos"])
+        end = chunk.rfind(b"\n") + 1   # una línea a medio escribir se lee la próxima vez
+        if not end:
+            return
+        state["pos"] += end
+
+        touched = set()
+        for line in chunk[:end].splitlines():
+            try:
+                rec = json.loads(line)
+                d = parse_date_flexible(rec["fecha"])
+                row = (d.toordinal(), mask_of(rec["nums"]))
+                key = (rec["kind"], rec["url"])
+            except Exception:
+                continue
+            _local_history.setdefault(key, []).append(row)
+            touched.add(key)
+        for kind, url in touched:
+            _apply_local_rows(kind, url)
+
+
+def _append_local_history(kind: str, url: str, rows):
+    """Guarda las filas en el historial compartido y las aplica en este proceso."""
+    if not LOCAL_HISTORY_PATH:
+        _local_history.setdefault((kind, url), []).extend(rows)
+        _apply_local_rows(kind, url)
+        return
+    data = "".join(json.dumps({"kind": kind, "url": url,
+                               "fecha": date.fromordinal(o).isoformat(),
+                               "nums": nums_of(m)}) + "\n" for o, m in rows)
+    os.makedirs(os.path.dirname(LOCAL_HISTORY_PATH) or ".", mode=0o700, exist_ok=True)
+    # una sola escritura en modo append: las líneas de distintos procesos no se mezclan
+    with open(LOCAL_HISTORY_PATH, "a", encoding="utf-8") as f:
+        f.write(data)
+    sync_local_history()
+
+
+def _apply_rows(kind: str, url: str, rows, old=None):
+    """
+    Agrega filas a la tabla en memoria (copia + inserción) y actualiza en O(filas):
+    conteos por número, versión y agregados de aciertos que dependan de esta fuente.
+    """
+    old = old or get_dataset(url, kind)
+    table = old["table"].with_rows(rows)
+    counts = list(old["counts"])
+    for _, m in rows:
+        for n in nums_of(m):
+            counts[n] += 1
+    h = hashlib.sha1(old["version"].encode())
+    for o, m in rows:
+        h.update(f"{o}:{m};".encode())
+    entry = {"table": table, "counts": counts, "fetched_at": old["fetched_at"],
+             "version": h.hexdigest()[:16]}
+    if old.get("decay"):
+        entry["decay"] = advance_decay_states(old.get("decay"), rows)
+
+    idx = 0 if kind == "sorteos" else 1
+    with _data_lock:
+        _datasets.put((kind, url), entry)
+        for key, agg in _hits_aggs.items():
+            if key[idx] != url or agg["versions"][idx] != old["version"]:
+                continue
+            other = _datasets.get(("jugadas", key[1]) if kind == "sorteos" else ("sorteos", key[0]))
+            if other is None or other["version"] != agg["versions"][1 - idx]:
+                continue
+            for o, m in rows:
+                if m.bit_count() != NUM_NUMBERS:
+                    continue
+                if kind == "sorteos":
+                    for jm in other["table"].rows_on(o):
+                        _add_hits(agg, (jm & m).bit_count())
+                else:
+                    draw_mask = other["table"].find(o)
+                    if draw_mask is not None:
+                        _add_hits(agg, (m & draw_mask).bit_count())
+            versions = list(agg["versions"])
+            versions[idx] = entry["version"]
+            agg["versions"] = tuple(versions)
+
+    schedule_snapshot_save()
+    return entry
+
+
+def loaded_version(kind: str, url: str):
+    """Versión de la fuente si ya está en memoria; None si todavía no se descargó."""
+    with _data_lock:
+        entry = _datasets.get((kind, url))
+    return entry["version"] if entry else None
+
+
+def ingest_draw(sorteos_url: str, d: date, nums) -> bool:
+    """
+    Agrega un resultado. False si ya estaba igual; IngestConflict si hay otro para esa fecha.
+    No descarga el Sheet: si la fuente no está en memoria (Sheets caído, arranque en frío)
+    se compara solo con lo ya ingresado y el próximo refresh la cruza con el Sheet.
+    """
+    o, m = d.toordinal(), mask_of(nums)
+    with _ingest_lock:
+        sync_local_history()
+        with _data_lock:
+            entry = _datasets.get(("sorteos", sorteos_url))
+        existing = entry["table"].find(o) if entry else None
+        if existing is None:
+            existing = next((pm for po, pm in _local_history.get(("sorteos", sorteos_url), ()) if po == o), None)
+        if existing == m:
+            return False
+        if existing is not None:
+            raise IngestConflict(f"Ya hay un resultado para {d.isoformat()}: {'-'.join(map(str, nums_of(existing)))}")
+        # primero el historial (compartido), después la tabla: un refresh nunca ve la fila a medias
+        _append_local_history("sorteos", sorteos_url, [(o, m)])
+    return True
+
+
+def ingest_jugadas(jugadas_url: str, d: date, combos) -> int:
+    """Agrega jugadas de una fecha (sin descargar el Sheet). Devuelve cuántas se agregaron."""
+    o = d.toordinal()
+    rows = [(o, mask_of(c)) for c in combos]
+    if not rows:
+        return 0
+    with _ingest_lock:
+        _append_local_history("jugadas", jugadas_url, rows)
+    return len(rows)
+
+
+# ---------- Tablas precalculadas por juego (archivos + mmap) ----------
+
+# Un archivo por juego y versión de reglas: encabezado JSON + columnas contiguas.
+# Cada proceso (workers de gunicorn y procesos de generación masiva) lo mapea en solo lectura:
+# las páginas vienen del page cache del sistema y no se duplican por proceso.
+TABLES_MAGIC = b"MLTABLE1"
+TABLES_FORMAT = 1
+VALID_WITH_SEQUENCES = 1   # flags: cumple las reglas si se permiten secuencias
+VALID_STRICT = 2           # flags: además no tiene 3+ consecutivos
+
+_game_tables = {}
+_game_tables_lock = threading.Lock()   # solo protege los dicts; la construcción va con el lock de su ruta
+_game_tables_building = {}             # ruta -> Lock
+
+
+def hypergeometric_table(picks: int, max_number: int):
+    """P(aciertos = h) de un boleto de `picks` números contra un sorteo de `picks` de `max_number`."""
+    total = math.comb(max_number, picks)
+    return [math.comb(picks, h) * math.comb(max_number - picks, picks - h) / total for h in range(picks + 1)]
+
+
+def build_game_tables(game: Game):
+    """
+    Columnas alineadas por rango lexicográfico de la combinación:
+    masks (bits), sums, evens, lows, maxs, runs (racha consecutiva más larga) y flags de validez;
+    más la tabla hipergeométrica de aciertos.
+    """
+    cols = {
+        "masks": array("Q"), "sums": array("H"), "evens": array("B"), "lows": array("B"),
+        "maxs": array("B"), "runs": array("B"), "flags": array("B"),
+    }
+    k = game.picks
+    for c in itertools.combinations(range(1, game.max_number + 1), k):
+        evens = sum(1 for n in c if n % 2 == 0)
+        lows = sum(1 for n in c if n <= game.low_max)
+        total = sum(c)
+        longest = run = 1
+        for a, b in zip(c, c[1:]):
+            run = run + 1 if b == a + 1 else 1
+            if run > longest:
+                longest = run
+        # ✅ los flags salen de las mismas reglas del plan, no de una copia
+        flags = 0
+        if is_valid_combination(c, True, game):
+            flags = VALID_WITH_SEQUENCES | (VALID_STRICT if is_valid_combination(c, False, game) else 0)
+        cols["masks"].append(mask_of(c))
+        cols["sums"].append(total)
+        cols["evens"].append(evens)
+        cols["lows"].append(lows)
+        cols["maxs"].append(c[-1])
+        cols["runs"].append(longest)
+        cols["flags"].append(flags)
+    cols["hyper"] = array("d", hypergeometric_table(k, game.max_number))
+    return cols
+
+
+def game_tables_path(game: Game) -> str:
+    return os.path.join(TABLES_DIR, f"{game.id}-{game.fingerprint()}.tbl")
+
+
+def write_game_tables(game: Game, path: str):
+    """Construye y escribe el archivo de tablas (reemplazo atómico)."""
+    cols = build_game_tables(game)
+    meta = {"format": TABLES_FORMAT, "byteorder": sys.byteorder, "game": game.rules(), "columns": {}}
+    offset = 0
+    for name, arr in cols.items():
+        meta["columns"][name] = [arr.typecode, offset, len(arr)]
+        offset += -(-len(arr) * arr.itemsize // 8) * 8   # cada columna arranca alineada a 8 bytes
+    head = json.dumps(meta).encode("utf-8")
+    head_size = -(-(len(TABLES_MAGIC) + 4 + len(head)) // 8) * 8
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".miloto_tables.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(TABLES_MAGIC + len(head).to_bytes(4, "little") + head)
+            f.write(b"\0" * (head_size - f.tell()))
+            for name, arr in cols.items():
+                data = arr.tobytes()
+                f.write(data + b"\0" * (-len(data) % 8))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def open_game_tables(path: str):
+    """Mapea el archivo y devuelve {columna: memoryview tipado}; None si no sirve (formato viejo)."""
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[:len(TABLES_MAGIC)] != TABLES_MAGIC:
+        return None
+    head_len = int.from_bytes(mm[len(TABLES_MAGIC):len(TABLES_MAGIC) + 4], "little")
+    start = len(TABLES_MAGIC) + 4
+    meta = json.loads(mm[start:start + head_len].decode("utf-8"))
+    if meta.get("format") != TABLES_FORMAT or meta.get("byteorder") != sys.byteorder:
+        return None
+    base = -(-(start + head_len) // 8) * 8
+    view = memoryview(mm)
+    tables = {}
+    for name, (typecode, offset, count) in meta["columns"].items():
+        size = array(typecode).itemsize
+        tables[name] = view[base + offset: base + offset + count * size].cast(typecode)
+    return tables
+
+
+def game_tables(game: Game):
+    """
+    Tablas del juego, mapeadas en memoria. Lo normal es que `flask build-tables` ya las haya
+    dejado en disco; si el archivo no existe (o es de otra versión) se construye una sola vez:
+    los demás hilos y procesos esperan el lock de esa ruta y mapean el mismo archivo.
+    Los otros juegos no esperan: el lock global solo cubre los dicts.
+    """
+    path = game_tables_path(game)
+    with _game_tables_lock:
+        tables = _game_tables.get(path)
+        if tables is not None:
+            return tables
+        building = _game_tables_building.setdefault(path, threading.Lock())
+    with building:
+        with _game_tables_lock:
+            tables = _game_tables.get(path)
+        if tables is not None:
+            return tables
+        tables = open_game_tables(path) if os.path.exists(path) else None
+        if tables is None:
+            os.makedirs(TABLES_DIR, mode=0o700, exist_ok=True)
+            with open(path + ".lock", "w") as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                tables = open_game_tables(path) if os.path.exists(path) else None
+                if tables is None:
+                    write_game_tables(game, path)
+                    tables = open_game_tables(path)
+        with _game_tables_lock:
+            _game_tables[path] = tables
+    return tables
+
+
+# ---------- Generación masiva de boletos (muestreo sin reemplazo) ----------
+
+def unrank_combination(items, k: int, rank: int):
+    """La combinación número `rank` (orden lexicográfico) de k elementos de `items`."""
+    out = []
+    start = 0
+    for slot in range(k):
+        for i in range(start, len(items)):
+            c = math.comb(len(items) - i - 1, k - slot - 1)
+            if rank < c:
+                out.append(items[i])
+                start = i + 1
+                break
+            rank -= c
+    return out
+
+
+def lazy_permutation(total: int, rnd: random.Random):
+    """Permutación aleatoria de range(total), perezosa (Fisher–Yates con swaps en un dict)."""
+    swaps = {}
+    for i in range(total):
+        j = rnd.randrange(i, total)
+        vi = swaps.pop(i, i)
+        vj = swaps.get(j, j)
+        if j != i:
+            swaps[j] = vi
+        yield vj
+
+
+class TicketSpace:
+    """
+    Espacio de boletos que generate_combination puede producir:
+    exactamente `hot_count` números de `hot` + el resto de los no calientes,
+    filtrado por is_valid_combination. Cada índice = (subconjunto hot, subconjunto no hot).
+    """
+
+    def __init__(self, hot_numbers, hot_count: int, allow_sequences: bool, game: Game = None):
+        game = game or GAMES[DEFAULT_GAME]
+        hot = sorted({n for n in hot_numbers if 1 <= n <= game.max_number})
+        hot_count = min(max(0, min(int(hot_count), 3)), len(hot))
+        non_hot = [n for n in range(1, game.max_number + 1) if n not in set(hot)]
+        if len(non_hot) < game.picks - hot_count:
+            # igual que generate_combination: si no alcanzan los no calientes, vale cualquiera
+            hot, hot_count, non_hot = [], 0, list(range(1, game.max_number + 1))
+        self.game = game
+        self.hot = hot
+        self.hot_count = hot_count
+        self.non_hot = non_hot
+        self.rest = game.picks - hot_count
+        self.allow_sequences = allow_sequences
+        self.n_hot = math.comb(len(hot), hot_count)
+        self.n_rest = math.comb(len(non_hot), self.rest)
+        self.total = self.n_hot * self.n_rest
+
+    def key(self):
+        return (self.game.id, self.game.fingerprint(), tuple(self.hot), self.hot_count, self.allow_sequences)
+
+    def combination(self, index: int):
+        h, r = divmod(index, self.n_rest)
+        return sorted(unrank_combination(self.hot, self.hot_count, h)
+                      + unrank_combination(self.non_hot, self.rest, r))
+
+    def sample_lazy(self, n: int, rnd: random.Random):
+        """Hasta n boletos válidos distintos recorriendo una permutación perezosa de índices."""
+        produced = 0
+        for idx in lazy_permutation(self.total, rnd):
+            c = self.combination(idx)
+            if is_valid_combination(c, self.allow_sequences, self.game):
+                yield c
+                produced += 1
+                if produced >= n:
+                    return
+
+
+def _filter_tables_chunk(game_id: str, start: int, end: int, hot_mask: int, hot_count: int, flag: int):
+    """
+    Trabajo de un proceso: máscaras válidas del rango [start, end) de la tabla del juego
+    con exactamente `hot_count` calientes. El proceso mapea el mismo archivo (nada se copia).
+    """
+    tables = game_tables(GAMES[game_id])
+    masks = tables["masks"][start:end]
+    flags = tables["flags"][start:end]
+    out = array("Q", [m for m, f in zip(masks, flags)
+                      if f & flag and (m & hot_mask).bit_count() == hot_count])
+    return out.tobytes()
+
+
+_bulk_pool = None
+_bulk_pool_lock = threading.Lock()
+_valid_spaces = BoundedLRU(32 * 1024 * 1024, lambda masks: masks.itemsize * len(masks))
+
+
+def _get_bulk_pool():
+    global _bulk_pool
+    with _bulk_pool_lock:
+        if _bulk_pool is None:
+            # forkserver: no se hace fork de un worker con hilos (cache, refrescos)
+            ctx = multiprocessing.get_context("forkserver")
+            _bulk_pool = ProcessPoolExecutor(max_workers=BULK_PROCESSES, mp_context=ctx)
+        return _bulk_pool
+
+
+def enumerate_valid(space: TicketSpace):
+    """Todas las combinaciones válidas del espacio (máscaras), filtrando la tabla precalculada del juego."""
+    key = space.key()
+    with _data_lock:
+        cached = _valid_spaces.get(key)
+    if cached is not None:
+        return cached
+
+    total = len(game_tables(space.game)["masks"])
+    flag = VALID_WITH_SEQUENCES if space.allow_sequences else VALID_STRICT
+    args = (space.game.id, mask_of(space.hot), space.hot_count, flag)
+    masks = array("Q")
+    if BULK_PROCESSES > 1 and total >= BULK_PARALLEL_MIN_ROWS:
+        step = -(-total // BULK_PROCESSES)
+        pool = _get_bulk_pool()
+        futures = [pool.submit(_filter_tables_chunk, args[0], start, min(start + step, total), *args[1:])
+                   for start in range(0, total, step)]
+        for f in futures:
+            masks.frombytes(f.result())
+    else:
+        masks.frombytes(_filter_tables_chunk(args[0], 0, total, *args[1:]))
+    with _data_lock:
+        _valid_spaces.put(key, masks)
+    return masks
+
+
+def sample_tickets(hot_numbers, hot_count: int, allow_sequences: bool, n: int, seed=None, game: Game = None):
+    """
+    n boletos válidos y distintos, uniformes sobre el espacio válido (sin reemplazo).
+    - n chico frente al espacio: permutación perezosa de índices (sin enumerar nada).
+    - n grande (o todo el espacio): se enumera el espacio válido en paralelo y se muestrea.
+    Devuelve un iterador de listas ordenadas.
+    """
+    rnd = random.Random(seed)
+    space = TicketSpace(hot_numbers, hot_count, allow_sequences, game)
+    if n * 4 < space.total:
+        return space.sample_lazy(n, rnd)
+    masks = enumerate_valid(space)
+    picks = rnd.sample(range(len(masks)), min(n, len(masks)))
+    max_number = space.game.max_number
+    return ([x for x in range(1, max_number + 1) if masks[i] >> x & 1] for i in picks)
+
+
+# ✅ Al importar (arranque o gunicorn --preload) cargamos el último snapshot:
+# el primer request ya tiene datos y dispara el refresco en segundo plano.
+sync_local_history()
+load_snapshot()
+
+
+# ---------- Verificación masiva de boletos (CSV subido) ----------
+
+# "4" y "04" -> bit del número, para armar la máscara sin int() por celda
+_NUM_BITS = {}
+for _n in range(1, MAX_NUMBER + 1):
+    _NUM_BITS[str(_n)] = _NUM_BITS[f"{_n:02d}"] = 1 << _n
+
+
+def _cell_bit(cell: str) -> int:
+    return _NUM_BITS.get(cell) or _NUM_BITS.get(cell.strip(), 0)
+
+
+def _ticket_layout(first_row):
+    """
+    (índice de fecha o None, índices de números, ¿la primera fila es encabezado?).
+    Acepta encabezados N1..N5 / J1..J5 (+ FECHA/fecha/fecha_iso) o filas sin encabezado
+    con 5 números, opcionalmente precedidos por la fecha.
+    """
+    cells = [c.strip() for c in first_row]
+    if len(cells) >= NUM_NUMBERS and all(_cell_bit(c) for c in cells[-NUM_NUMBERS:]):
+        if len(cells) > NUM_NUMBERS and parse_date_flexible(cells[0]):
+            return 0, list(range(len(cells) - NUM_NUMBERS, len(cells))), False
+        return None, list(range(len(cells) - NUM_NUMBERS, len(cells))), False
+
+    pos = {name: i for i, name in enumerate(cells)}
+    for cols in SOURCE_KINDS.values():
+        num_idx = [pos[k] for k in cols["num_keys"] if k in pos]
+        if len(num_idx) == NUM_NUMBERS:
+            break
+    else:
+        raise ValueError("No reconozco las columnas: usa N1..N5 o J1..J5 (y FECHA opcional)")
+    date_keys = [k for cols in SOURCE_KINDS.values() for k in cols["date_keys"]]
+    date_idx = next((pos[k] for k in date_keys if k in pos), None)
+    return date_idx, num_idx, True
+
+
+def verify_tickets(lines, draw_nums=None, sorteos: DrawTable = None,
+                   min_hits: int = 2, max_matches: int = VERIFY_MAX_MATCHES):
+    """
+    Verifica boletos leídos de `lines` (un iterable de líneas CSV, se recorre una sola vez)
+    contra un resultado (`draw_nums`) o contra la historia de SORTEOS por fecha (`sorteos`).
+    Se procesa por lotes: cada boleto es una máscara en un array('Q') y los aciertos salen de
+    popcount(boleto & sorteo) aplicado con map() a todo el lote.
+    """
+    reader = csv.reader(lines)
+    first = next(reader, None)
+    result = {
+        "total": 0, "invalid": 0, "no_date": 0, "no_draw": 0,
+        "dist": {i: 0 for i in range(0, NUM_NUMBERS + 1)},
+        "tickets": 0, "premios": 0, "matches": [], "matches_truncated": False,
+    }
+    if first is None:
+        return result
+    date_idx, num_idx, has_header = _ticket_layout(first)
+    rows = reader if has_header else itertools.chain([first], reader)
+    row_offset = 2 if has_header else 1
+
+    single_mask = mask_of(draw_nums) if draw_nums else None
+    if single_mask is None and sorteos is None:
+        raise ValueError("Falta el resultado o la historia de SORTEOS")
+    if single_mask is None and date_idx is None:
+        raise ValueError("Para cruzar contra SORTEOS el archivo necesita una columna de fecha")
+
+    ordinals_cache = {}
+    draws_cache = {}
+    last = max(num_idx)
+    dist = result["dist"]
+    matches = result["matches"]
+
+    def flush(line_nos, ords, masks, draws):
+        if single_mask is not None:
+            hits = list(map(int.bit_count, map(single_mask.__and__, masks)))
         else:
-            draw_set = set(draw_nums)
-            verify_rows = []
-            for d, n, cs in calendar:
-                for c in cs:
-                    hits = len(set(c) & draw_set)
-                    verify_rows.append({
-                        "date": d,
-                        "combo": c,
-                        "hits": hits,
-                        "msg": classify_hits(hits)
+            hits = list(map(int.bit_count, map(int.__and__, masks, draws)))
+        for h, c in Counter(hits).items():
+            dist[h] += c
+        if not result["matches_truncated"]:
+            for i, h in enumerate(hits):
+                if h >= min_hits:
+                    if len(matches) >= max_matches:
+                        result["matches_truncated"] = True
+                        break
+                    matches.append({
+                        "row": line_nos[i],
+                        "fecha": date.fromordinal(ords[i]).isoformat() if ords[i] else None,
+                        "combo": nums_of(masks[i]),
+                        "hits": h,
+                        "msg": classify_hits(h),
                     })
 
-    day_names = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
-    month_names = ["enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto",
-                   "septiembre", "octubre", "noviembre", "diciembre"]
+    line_nos, ords, masks, draws = [], [], array("Q"), array("Q")
+    for line_no, row in enumerate(rows, start=row_offset):
+        if not row:
+            continue
+        if len(row) <= last:
+            result["invalid"] += 1
+            continue
+        m = 0
+        for i in num_idx:
+            m |= _cell_bit(row[i])
+        if m.bit_count() != NUM_NUMBERS:
+            result["invalid"] += 1
+            continue
+
+        o = 0
+        if date_idx is not None:
+            raw = row[date_idx]
+            o = ordinals_cache.get(raw)
+            if o is None:
+                d = parse_date_flexible(raw)
+                o = ordinals_cache[raw] = d.toordinal() if d else 0
+        if single_mask is None:
+            if not o:
+                result["no_date"] += 1
+                continue
+            dm = draws_cache.get(o, -1)
+            if dm == -1:
+                dm = draws_cache[o] = sorteos.find(o)
+            if dm is None:
+                result["no_draw"] += 1
+                continue
+            draws.append(dm)
+
+        line_nos.append(line_no)
+        ords.append(o)
+        masks.append(m)
+        if len(masks) >= VERIFY_BATCH_ROWS:
+            flush(line_nos, ords, masks, draws)
+            line_nos, ords, masks, draws = [], [], array("Q"), array("Q")
+    if masks:
+        flush(line_nos, ords, masks, draws)
+
+    result["total"] = sum(dist.values())
+    result["tickets"] = dist[2]
+    result["premios"] = sum(c for h, c in dist.items() if h >= 3)
+    return result
+
+
+# ---------- Estáticos con huella + compresión ----------
+
+_asset_hashes = {}
+_compressed_static = {}   # (archivo, huella real, encoding) -> bytes
+
+
+def asset_hash(filename: str) -> str:
+    """Huella del contenido de un archivo de /static (se calcula una vez por proceso)."""
+    h = _asset_hashes.get(filename)
+    if h is None:
+        with open(os.path.join(app.static_folder, filename), "rb") as f:
+            h = _asset_hashes[filename] = hashlib.sha1(f.read()).hexdigest()[:12]
+    return h
+
 
-    html = """
+def asset_url(filename: str) -> str:
+    """URL de un archivo de /static con huella de contenido (?v=hash) para cache largo."""
+    return url_for("static", filename=filename, v=asset_hash(filename))
+
+
+app.jinja_env.globals["asset_url"] = asset_url
+
+
+def _pick_encoding(accept: str):
+    accept = accept or ""
+    if brotli is not None and "br" in accept:
+        return "br"
+    if "gzip" in accept:
+        return "gzip"
+    return None
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+@app.after_request
+def cache_and_compress(response):
+    is_static = request.endpoint == "static"
+    static_hash = None
+    if is_static and response.status_code == 200:
+        static_hash = asset_hash(request.view_args["filename"])
+    if static_hash and request.args.get("v") == static_hash:
+        # con la huella correcta: el contenido de esa URL nunca cambia
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+
+    # send_file entrega un iterable de archivo: para estáticos sí lo leemos
+    if (response.status_code != 200 or (response.is_streamed and not is_static)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = _pick_encoding(request.headers.get("Accept-Encoding"))
+    if encoding is None:
+        return response
+
+    response.direct_passthrough = False
+    if is_static:
+        # la clave es la huella real: un ?v= inventado no agrega entradas
+        key = (request.view_args["filename"], static_hash, encoding)
+        body = _compressed_static.get(key)
+        if body is None:
+            data = response.get_data()
+            if len(data) < COMPRESS_MIN_BYTES:
+                return response
+            body = _compressed_static[key] = _compress(data, encoding)
+        response.close()
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        body = _compress(data, encoding)
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    # otra representación de los mismos bytes: el ETag fuerte de la versión sin comprimir ya no aplica
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+@app.before_request
+def start_request_deadline():
+    # ✅ Presupuesto total de tiempo para todo lo que el request descargue
+    g.deadline = time.monotonic() + REQUEST_DEADLINE_SECONDS
+
+
+# ---------- Perfilado bajo demanda ----------
+
+_profiles = []          # los PROFILE_KEEP requests perfilados más lentos
+_profiles_lock = threading.Lock()
+
+
+class _LoadedProfile:
+    """Adaptador para que pstats.Stats lea un dict de stats ya guardado."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def _profile_token_ok() -> bool:
+    # solo por header: en la query string el token quedaría en logs y proxies
+    token = request.headers.get("X-Profile-Token", "")
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+def profile_summary(stats: dict, duration: float, limit: int = 25) -> str:
+    """Texto: barras por función de app.py (tipo flame graph plano) + top de pstats."""
+    out = io.StringIO()
+    out.write(f"Duración total: {duration * 1000:.1f} ms\n\n")
+
+    here = os.path.abspath(__file__)
+    ours = []
+    for (filename, line, func), (_, _, _, cumtime, _) in stats.items():
+        if os.path.abspath(filename) == here:
+            ours.append((cumtime, f"{func}:{line}"))
+    ours.sort(reverse=True)
+    if ours:
+        top = ours[0][0] or 1e-9
+        out.write("Tiempo acumulado por función de la app:\n")
+        for cumtime, name in ours[:limit]:
+            bar = "█" * max(1, int(40 * cumtime / top))
+            out.write(f"  {cumtime * 1000:9.2f} ms  {bar} {name}\n")
+        out.write("\n")
+
+    ps = pstats.Stats(_LoadedProfile(stats), stream=out)
+    ps.sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+def _store_profile(record: dict):
+    with _profiles_lock:
+        _profiles.append(record)
+        _profiles.sort(key=lambda r: r["duration"], reverse=True)
+        del _profiles[PROFILE_KEEP:]
+
+
+def _find_profile(pid: str):
+    with _profiles_lock:
+        return next((r for r in _profiles if r["id"] == pid), None)
+
+
+def _profile_download(record: dict):
+    return app.response_class(marshal.dumps(record["stats"]), mimetype="application/octet-stream", headers={
+        "Content-Disposition": f"attachment; filename=miloto_{record['id']}.prof",
+    })
+
+
+@app.before_request
+def start_profiling():
+    mode = request.args.get("_profile") or request.headers.get("X-Profile")
+    if not mode or request.endpoint in ("static", None) or request.path.startswith("/debug/"):
+        return None
+    if not _profile_token_ok():
+        return jsonify(ok=False, error="Token de perfilado inválido"), 401
+    g.profile_mode = mode
+    g.profile_started = time.perf_counter()
+    g.profiler = cProfile.Profile()
+    g.profiler.enable()
+    return None
+
+
+@app.after_request
+def finish_profiling(response):
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return response
+    if response.is_streamed:
+        # el cuerpo de un stream se genera al iterarlo: lo consumimos aquí para medirlo
+        response.make_sequence()
+    profiler.disable()
+    duration = time.perf_counter() - g.profile_started
+    profiler.create_stats()
+    record = {
+        "id": hashlib.sha1(f"{time.time()}:{request.full_path}".encode()).hexdigest()[:12],
+        "path": request.path,
+        "query": request.query_string.decode("utf-8", errors="replace"),
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "duration": duration,
+        "stats": profiler.stats,
+    }
+    _store_profile(record)
+
+    if g.profile_mode == "summary":
+        response = app.response_class(profile_summary(record["stats"], duration), mimetype="text/plain")
+    elif g.profile_mode == "download":
+        response = _profile_download(record)
+    response.headers["X-Profile-Id"] = record["id"]
+    response.headers["X-Profile-Duration-Ms"] = f"{duration * 1000:.1f}"
+    return response
+
+
+@app.route("/debug/profiles", methods=["GET"])
+def debug_profiles():
+    """Lista los requests perfilados más lentos (requiere token)."""
+    if not _profile_token_ok():
+        return jsonify(ok=False, error="Token de perfilado inválido"), 401
+    with _profiles_lock:
+        items = [{k: v for k, v in r.items() if k != "stats"} for r in _profiles]
+    return jsonify(ok=True, profiles=items)
+
+
+@app.route("/debug/profiles/<pid>", methods=["GET"])
+def debug_profile(pid):
+    """Resumen en texto o, con ?format=prof, el archivo para snakeviz/pstats."""
+    if not _profile_token_ok():
+        return jsonify(ok=False, error="Token de perfilado inválido"), 401
+    record = _find_profile(pid)
+    if record is None:
+        return jsonify(ok=False, error="Perfil no encontrado (quizá salió del top)"), 404
+    if request.args.get("format") == "prof":
+        return _profile_download(record)
+    return app.response_class(profile_summary(record["stats"], record["duration"]), mimetype="text/plain")
+
+
+@app.route("/debug/fetches", methods=["GET"])
+def debug_fetches():
+    """Descargas a Sheets: bytes, tiempo y conexiones por host en este worker (requiere token)."""
+    if not _profile_token_ok():
+        return jsonify(ok=False, error="Token de perfilado inválido"), 401
+    return jsonify(ok=True, pid=os.getpid(), **_transport.report())
+
+
+# ---------- Plantillas ----------
+# Se registran una vez en un DictLoader: Jinja las compila la primera vez y las reutiliza
+# (render_template_string recompilaba la página completa en cada request).
+
+PAGE_TEMPLATE = """
 <html lang="es">
 <head>
   <meta charset="UTF-8" />
   <meta name="viewport" content="width=device-width, initial-scale=1.0" />
   <title>MiLoto — Plan Quincenal</title>
-  <style>
-    body { font-family: Arial, sans-serif; margin: 18px; background: #f5f6f7; }
-    h1 { margin: 0 0 10px 0; }
-    .card { background:#fff; border-radius:12px; padding:14px; margin:10px 0; }
-    .date { font-weight:700; margin-bottom:8px; }
-    .tag { display:inline-block; padding:2px 9px; border-radius:999px; font-size:12px; background:#eef; margin-left:8px; }
-    .combo { margin:6px 0; font-size:16px; }
-    .note { font-size:13px; color:#444; margin:10px 0; line-height:1.35; }
-    .row { display:flex; gap:10px; flex-wrap:wrap; align-items:flex-end; }
-    input, select { padding:10px; border-radius:10px; border:1px solid #ccc; }
-    button { padding:10px 14px; border:0; border-radius:10px; background:#111; color:#fff; cursor:pointer; }
-    .error { background:#ffecec; border:1px solid #ffb2b2; padding:10px; border-radius:10px; color:#7a0000; }
-    .warn { background:#fff7e6; border:1px solid #ffd38a; padding:10px; border-radius:10px; color:#6b4300; }
-    .hint { font-size:12px; color:#666; margin-top:6px; }
-    label { font-size:12px; color:#333; display:block; margin-bottom:6px; }
-    .field { min-width: 220px; }
-    .small { font-size:12px; color:#555; }
-    table { border-collapse: collapse; width: 100%; }
-    th, td { border-bottom: 1px solid #eee; padding: 8px; text-align: left; font-size: 13px; }
-    th { font-weight: 700; }
-    .muted { color:#777; }
-    .pill { display:inline-block; padding:3px 10px; border-radius:999px; font-size:12px; background:#f0f0f0; margin-right:6px; }
-  </style>
+  <link rel="stylesheet" href="{{ asset_url('app.css') }}">
 </head>
 <body>
   <h1>MiLoto — Plan quincenal (12 apuestas)</h1>
+  {% if tenant_name %}
+    <div class="small muted">Grupo: <b>{{ tenant_name }}</b></div>
+    <input id="tenant" type="hidden" value="{{ tenant|e }}">
+  {% endif %}
 
   <div class="note">
     Regla: dobles en <b>lunes</b> y <b>viernes</b>. Si caen en 14–15 o 29–30, movemos el “extra” a martes/jueves para reducir competencia.
   </div>
 
-  {% if error %}
-    <div class="error"><b>Error en tus números calientes:</b> {{ error }}</div>
-  {% endif %}
+  <div id="hotError">
+    {% if error %}
+      <div class="error"><b>Error en tus números calientes:</b> {{ error }}</div>
+    {% endif %}
+  </div>
+
+  <div id="dataStamp">
+    {% if data_stamp %}
+      <div class="note muted">Datos de Google Sheets al {{ data_stamp.strftime('%Y-%m-%d %H:%M') }} (se actualizan solos en segundo plano).</div>
+    {% endif %}
+  </div>
 
   {% if sheets_error %}
     <div class="warn"><b>Google Sheets:</b> {{ sheets_error }}</div>
@@ -660,40 +2459,7 @@ def index():
       </div>
     </div>
 
-    {% if draw_invalid %}
-      <div class="warn" style="margin-top:10px;">
-        Resultado inválido. Deben ser 5 números (1..39) sin repetir.
-      </div>
-    {% endif %}
-
-    {% if verify_rows %}
-      <div style="margin-top:12px;">
-        <div class="small"><b>Resultados vs tus jugadas del plan actual</b></div>
-        <table style="margin-top:6px;">
-          <thead>
-            <tr>
-              <th>Fecha</th>
-              <th>Jugada</th>
-              <th>Aciertos</th>
-              <th>Clasificación</th>
-            </tr>
-          </thead>
-          <tbody>
-            {% for r in verify_rows %}
-              <tr>
-                <td>{{ day_names[r.date.weekday()] }} {{ r.date.day }}/{{ r.date.month }}/{{ r.date.year }}</td>
-                <td><b>{{ r.combo|join(' - ') }}</b></td>
-                <td><b>{{ r.hits }}</b></td>
-                <td>{{ r.msg }}</td>
-              </tr>
-            {% endfor %}
-          </tbody>
-        </table>
-        <div class="hint" style="margin-top:8px;">
-          Esto solo “clasifica” según aciertos; confirma reglas exactas en la plataforma (pueden variar).
-        </div>
-      </div>
-    {% endif %}
+    <div id="verifyResult">{% include "verify.html" %}</div>
   </div>
 
   <div class="card">
@@ -702,12 +2468,12 @@ def index():
     <div class="row">
       <div class="field" style="flex:2; min-width:260px;">
         <label>CSV Sorteos (EXPORT_SORTEOS)</label>
-        <input id="sorteosCsv" style="width:100%;" value="{{ sorteos_url|e }}">
+        <input id="sorteosCsv" style="width:100%;" value="{{ sorteos_url|e }}" {% if not allow_custom_csv %}readonly{% endif %}>
       </div>
 
       <div class="field" style="flex:2; min-width:260px;">
         <label>CSV Jugadas (JUGADAS)</label>
-        <input id="jugadasCsv" style="width:100%;" value="{{ jugadas_url|e }}">
+        <input id="jugadasCsv" style="width:100%;" value="{{ jugadas_url|e }}" {% if not allow_custom_csv %}readonly{% endif %}>
       </div>
 
       <div class="field">
@@ -719,6 +2485,23 @@ def index():
         </select>
       </div>
 
+      <div class="field">
+        <label>Fuente de sugerencia</label>
+        <select id="hotSource">
+          <option value="history" {% if hot_source == 'history' %}selected{% endif %}>Opción C (todo el historial)</option>
+          <option value="decay" {% if hot_source == 'decay' %}selected{% endif %}>Recientes (decaimiento)</option>
+        </select>
+      </div>
+
+      <div class="field">
+        <label>Vida media (sorteos)</label>
+        <select id="halfLife">
+          {% for k in decay_half_lives %}
+            <option value="{{k}}" {% if k == half_life_int %}selected{% endif %}>{{k}}</option>
+          {% endfor %}
+        </select>
+      </div>
+
       <div class="field">
         <label>Mín. veces jugado</label>
         <select id="minPlayed">
@@ -735,33 +2518,7 @@ def index():
       * La app se actualiza sola con tus datos del Sheet al recargar. Render Free puede “dormirse” y tardar unos segundos en despertar.
     </div>
 
-    {% if hot_stats_table %}
-      <div style="margin-top:12px;">
-        <div class="small"><b>Top sugerencias (score suavizado = (freq+1)/(jugado+2))</b></div>
-        <table style="margin-top:6px;">
-          <thead>
-            <tr>
-              <th>Número</th>
-              <th>Frecuencia</th>
-              <th>Veces jugado</th>
-              <th>Ratio salida/jugado</th>
-              <th>Score</th>
-            </tr>
-          </thead>
-          <tbody>
-            {% for r in hot_stats_table %}
-              <tr>
-                <td><b>{{ r.n }}</b></td>
-                <td>{{ r.freq }}</td>
-                <td>{{ r.played }}</td>
-                <td>{{ "%.3f"|format(r.ratio) }}</td>
-                <td>{{ "%.3f"|format(r.score) }}</td>
-              </tr>
-            {% endfor %}
-          </tbody>
-        </table>
-      </div>
-    {% endif %}
+    <div id="suggestResult">{% if suggest_html %}{{ suggest_html }}{% endif %}</div>
   </div>
 
   <div class="card">
@@ -780,252 +2537,819 @@ def index():
       <button id="statsBtn" type="button">📊 Actualizar resumen</button>
     </div>
 
-    {% if stats_error %}
-      <div class="warn" style="margin-top:10px;"><b>Stats:</b> {{ stats_error }}</div>
-    {% endif %}
+    <div id="statsResult">
+      {% if stats_error %}
+        <div class="warn" style="margin-top:10px;"><b>Stats:</b> {{ stats_error }}</div>
+      {% endif %}
 
-    {% if stats_enabled and jugadas_summary %}
-      <div style="margin-top:12px;">
-        <div class="small">
-          <b>Total jugadas evaluadas:</b> {{ jugadas_summary.total }} |
-          <b>Tickets:</b> {{ jugadas_summary.tickets }} |
-          <b>Premios (3+):</b> {{ jugadas_summary.premios }}
-        </div>
+      {% if stats_enabled and stats_html %}{{ stats_html }}{% endif %}
+    </div>
+  </div>
 
-        <div class="small" style="margin-top:8px;">
-          <b>Distribución de aciertos:</b>
-          0: {{ jugadas_summary.dist[0] }},
-          1: {{ jugadas_summary.dist[1] }},
-          2: {{ jugadas_summary.dist[2] }},
-          3: {{ jugadas_summary.dist[3] }},
-          4: {{ jugadas_summary.dist[4] }},
-          5: {{ jugadas_summary.dist[5] }}
-        </div>
+  <div id="plan">{% include "plan.html" %}</div>
 
-        {% if current_hot %}
-          <div class="small" style="margin-top:10px;">
-            <b>Hot actuales (últimos 20 sorteos):</b> {{ current_hot|join(', ') }}
-            {% if current_hot_range and current_hot_range[0] and current_hot_range[1] %}
-              <span class="muted"> ({{ current_hot_range[0] }} → {{ current_hot_range[1] }})</span>
-            {% endif %}
-          </div>
-        {% endif %}
-
-        {% if jugadas_recent %}
-          <div style="margin-top:12px;">
-            <div class="small"><b>Últimas jugadas (cruce por fecha)</b></div>
-            <table style="margin-top:6px;">
-              <thead>
-                <tr>
-                  <th>Fecha</th>
-                  <th>Jugada</th>
-                  <th>Aciertos</th>
-                  <th>Resultado</th>
-                </tr>
-              </thead>
-              <tbody>
-                {% for r in jugadas_recent %}
-                  <tr>
-                    <td>{{ r.date }}</td>
-                    <td><b>{{ r.combo|join(' - ') }}</b></td>
-                    <td>{% if r.hits is not none %}<b>{{ r.hits }}</b>{% else %}—{% endif %}</td>
-                    <td>{{ r.msg }}</td>
-                  </tr>
-                {% endfor %}
-              </tbody>
-            </table>
-          </div>
-        {% endif %}
-      </div>
-    {% endif %}
+  <div class="note">
+    Importante: en MiLoto el orden no importa; ganas si tus 5 números coinciden con los 5 del sorteo.
   </div>
 
-  {% for d, n, combos in calendar %}
-    <div class="card">
-      <div class="date">
-        {{ day_names[d.weekday()] }} {{ d.day }} de {{ month_names[d.month-1] }} de {{ d.year }}
-        {% if d.day in payroll_days %}
-          <span class="tag">posible alta compra</span>
-        {% endif %}
-        <span class="tag">{{ n }} apuesta(s)</span>
-      </div>
-      {% for c in combos %}
-        <div class="combo">➡️ <b>{{ c|join(' - ') }}</b></div>
-      {% endfor %}
+  <script src="{{ asset_url('app.js') }}"></script>
+</body>
+</html>
+"""
+
+# Fragmento del plan (tarjetas por fecha); las jugadas llevan data-* para verificar sin regenerar
+PLAN_TEMPLATE = """
+{% for d, n, combos in calendar %}
+  <div class="card">
+    <div class="date">
+      {{ day_names[d.weekday()] }} {{ d.day }} de {{ month_names[d.month-1] }} de {{ d.year }}
+      {% if d.day in payroll_days %}
+        <span class="tag">posible alta compra</span>
+      {% endif %}
+      <span class="tag">{{ n }} apuesta(s)</span>
     </div>
-  {% endfor %}
+    {% for c in combos %}
+      <div class="combo" data-date="{{ d.isoformat() }}" data-combo="{{ c|join('-') }}">➡️ <b>{{ c|join(' - ') }}</b></div>
+    {% endfor %}
+  </div>
+{% endfor %}
+"""
 
-  <div class="note">
-    Importante: en MiLoto el orden no importa; ganas si tus 5 números coinciden con los 5 del sorteo.
+# Fragmento de verificación de aciertos contra el plan actual
+VERIFY_TEMPLATE = """
+{% if draw_invalid %}
+  <div class="warn" style="margin-top:10px;">
+    Resultado inválido. Deben ser 5 números (1..39) sin repetir.
+  </div>
+{% endif %}
+
+{% if verify_rows %}
+  <div style="margin-top:12px;">
+    <div class="small"><b>Resultados vs tus jugadas del plan actual</b></div>
+    <table style="margin-top:6px;">
+      <thead>
+        <tr>
+          <th>Fecha</th>
+          <th>Jugada</th>
+          <th>Aciertos</th>
+          <th>Clasificación</th>
+        </tr>
+      </thead>
+      <tbody>
+        {% for r in verify_rows %}
+          <tr>
+            <td>{{ day_names[r.date.weekday()] }} {{ r.date.day }}/{{ r.date.month }}/{{ r.date.year }}</td>
+            <td><b>{{ r.combo|join(' - ') }}</b></td>
+            <td><b>{{ r.hits }}</b></td>
+            <td>{{ r.msg }}</td>
+          </tr>
+        {% endfor %}
+      </tbody>
+    </table>
+    <div class="hint" style="margin-top:8px;">
+      Esto solo “clasifica” según aciertos; confirma reglas exactas en la plataforma (pueden variar).
+    </div>
+  </div>
+{% endif %}
+"""
+
+# Fragmento "Top sugerencias" (cacheado por versión de datos + parámetros)
+SUGGEST_TABLE_TEMPLATE = """
+{% if hot_stats_table and hot_source == 'decay' %}
+  <div style="margin-top:12px;">
+    <div class="small"><b>Top sugerencias (frecuencia con decaimiento, vida media {{ half_life_int }} sorteos)</b></div>
+    <table style="margin-top:6px;">
+      <thead>
+        <tr>
+          <th>Número</th>
+          <th>Frecuencia decaída</th>
+          <th>Score (prob. reciente)</th>
+        </tr>
+      </thead>
+      <tbody>
+        {% for r in hot_stats_table %}
+          <tr>
+            <td><b>{{ r.n }}</b></td>
+            <td>{{ "%.2f"|format(r.decayed) }}</td>
+            <td>{{ "%.3f"|format(r.score) }}</td>
+          </tr>
+        {% endfor %}
+      </tbody>
+    </table>
+  </div>
+{% elif hot_stats_table %}
+  <div style="margin-top:12px;">
+    <div class="small"><b>Top sugerencias (score suavizado = (freq+1)/(jugado+2))</b></div>
+    <table style="margin-top:6px;">
+      <thead>
+        <tr>
+          <th>Número</th>
+          <th>Frecuencia</th>
+          <th>Veces jugado</th>
+          <th>Ratio salida/jugado</th>
+          <th>Score</th>
+        </tr>
+      </thead>
+      <tbody>
+        {% for r in hot_stats_table %}
+          <tr>
+            <td><b>{{ r.n }}</b></td>
+            <td>{{ r.freq }}</td>
+            <td>{{ r.played }}</td>
+            <td>{{ "%.3f"|format(r.ratio) }}</td>
+            <td>{{ "%.3f"|format(r.score) }}</td>
+          </tr>
+        {% endfor %}
+      </tbody>
+    </table>
+  </div>
+{% endif %}
+"""
+
+# Fragmento "Resumen estadístico" (cacheado por versión de datos)
+STATS_TEMPLATE = """
+<div style="margin-top:12px;">
+  <div class="small">
+    <b>Total jugadas evaluadas:</b> {{ jugadas_summary.total }} |
+    <b>Tickets:</b> {{ jugadas_summary.tickets }} |
+    <b>Premios (3+):</b> {{ jugadas_summary.premios }}
   </div>
 
-  <script>
-    const hotInput = document.getElementById('hotInput');
-    const hotCount = document.getElementById('hotCount');
-    const startDate = document.getElementById('startDate');
-    const sorteosCsv = document.getElementById('sorteosCsv');
-    const jugadasCsv = document.getElementById('jugadasCsv');
-    const topN = document.getElementById('topN');
-    const minPlayed = document.getElementById('minPlayed');
-    const allowSeq = document.getElementById('allowSeq');
-
-    const drawInput = document.getElementById('drawInput');
-
-    const statsToggle = document.getElementById('statsToggle');
-    const statsBtn = document.getElementById('statsBtn');
-
-    const saveBtn = document.getElementById('saveBtn');
-    const genBtn  = document.getElementById('genBtn');
-    const suggestBtn = document.getElementById('suggestBtn');
-    const checkBtn = document.getElementById('checkBtn');
-
-    function loadSettings(){
-      const savedHot = localStorage.getItem('miloto_hot');
-      const savedCount = localStorage.getItem('miloto_hot_count');
-      const savedStart = localStorage.getItem('miloto_start');
-      const savedSorteos = localStorage.getItem('miloto_sorteos_csv');
-      const savedJugadas = localStorage.getItem('miloto_jugadas_csv');
-      const savedTopN = localStorage.getItem('miloto_topn');
-      const savedMinPlayed = localStorage.getItem('miloto_min_played');
-      const savedAllowSeq = localStorage.getItem('miloto_allow_seq');
-      const savedDraw = localStorage.getItem('miloto_draw');
-      const savedStats = localStorage.getItem('miloto_stats');
-
-      if(savedHot && !hotInput.value) hotInput.value = savedHot;
-      if(savedCount) hotCount.value = savedCount;
-
-      if(savedStart && (!startDate.value || startDate.value.trim().length === 0)) {
-        startDate.value = savedStart;
-      }
-      if(!startDate.value || startDate.value.trim().length === 0){
-        const today = new Date();
-        const yyyy = today.getFullYear();
-        const mm = String(today.getMonth()+1).padStart(2,'0');
-        const dd = String(today.getDate()).padStart(2,'0');
-        startDate.value = `${yyyy}-${mm}-${dd}`;
-      }
-
-      if(savedSorteos && (!sorteosCsv.value || sorteosCsv.value.trim().length === 0)) sorteosCsv.value = savedSorteos;
-      if(savedJugadas && (!jugadasCsv.value || jugadasCsv.value.trim().length === 0)) jugadasCsv.value = savedJugadas;
-      if(savedTopN) topN.value = savedTopN;
-      if(savedMinPlayed) minPlayed.value = savedMinPlayed;
-      if(savedAllowSeq) allowSeq.value = savedAllowSeq;
-      if(savedDraw && (!drawInput.value || drawInput.value.trim().length === 0)) drawInput.value = savedDraw;
-      if(savedStats) statsToggle.value = savedStats;
+  <div class="small" style="margin-top:8px;">
+    <b>Distribución de aciertos:</b>
+    0: {{ jugadas_summary.dist[0] }},
+    1: {{ jugadas_summary.dist[1] }},
+    2: {{ jugadas_summary.dist[2] }},
+    3: {{ jugadas_summary.dist[3] }},
+    4: {{ jugadas_summary.dist[4] }},
+    5: {{ jugadas_summary.dist[5] }}
+  </div>
+
+  {% if current_hot %}
+    <div class="small" style="margin-top:10px;">
+      <b>Hot actuales (últimos 20 sorteos):</b> {{ current_hot|join(', ') }}
+      {% if current_hot_range and current_hot_range[0] and current_hot_range[1] %}
+        <span class="muted"> ({{ current_hot_range[0] }} → {{ current_hot_range[1] }})</span>
+      {% endif %}
+    </div>
+  {% endif %}
+
+  {% if jugadas_recent %}
+    <div style="margin-top:12px;">
+      <div class="small"><b>Últimas jugadas (cruce por fecha)</b></div>
+      <table style="margin-top:6px;">
+        <thead>
+          <tr>
+            <th>Fecha</th>
+            <th>Jugada</th>
+            <th>Aciertos</th>
+            <th>Resultado</th>
+          </tr>
+        </thead>
+        <tbody>
+          {% for r in jugadas_recent %}
+            <tr>
+              <td>{{ r.date }}</td>
+              <td><b>{{ r.combo|join(' - ') }}</b></td>
+              <td>{% if r.hits is not none %}<b>{{ r.hits }}</b>{% else %}—{% endif %}</td>
+              <td>{{ r.msg }}</td>
+            </tr>
+          {% endfor %}
+        </tbody>
+      </table>
+    </div>
+  {% endif %}
+</div>
+"""
+
+TEMPLATES = {
+    "page.html": PAGE_TEMPLATE,
+    "plan.html": PLAN_TEMPLATE,
+    "verify.html": VERIFY_TEMPLATE,
+    "suggest_table.html": SUGGEST_TABLE_TEMPLATE,
+    "stats.html": STATS_TEMPLATE,
+}
+TEMPLATES_VERSION = hashlib.sha1("".join(TEMPLATES.values()).encode("utf-8")).hexdigest()[:12]
+app.jinja_env.loader = ChoiceLoader([app.jinja_env.loader, DictLoader(TEMPLATES)])
+
+
+# ---------- Fragmentos cacheados ----------
+# Las tarjetas "Top sugerencias" y "Resumen estadístico" solo dependen de los datos del Sheet
+# y de unos pocos parámetros: se guardan ya renderizadas en `derived`, así que se invalidan
+# solas cuando cambia la versión del dataset (y con TEMPLATES_VERSION cuando cambia la plantilla).
+
+def suggest_fragment(sorteos_url: str, jugadas_url: str, hot_source: str,
+                     top_n: int, min_played: int, half_life: int):
+    """(hot sugeridos, html de la tabla "Top sugerencias")."""
+    if hot_source == "decay":
+        sources = [("sorteos", sorteos_url)]
+        params = (TEMPLATES_VERSION, hot_source, top_n, half_life)
+    else:
+        sources = [("sorteos", sorteos_url), ("jugadas", jugadas_url)]
+        params = (TEMPLATES_VERSION, hot_source, top_n, min_played)
+
+    def build():
+        if hot_source == "decay":
+            suggested, table = compute_decayed_hot(sorteos_url=sorteos_url, half_life=half_life, top_n=top_n)
+        else:
+            suggested, _, table = derived(
+                "hot_history", sources, (top_n, min_played),
+                lambda: compute_hot_from_history(
+                    sorteos_url=sorteos_url, jugadas_url=jugadas_url, top_n=top_n, min_played=min_played
+                )
+            )
+        html = render_template("suggest_table.html", hot_stats_table=table,
+                               hot_source=hot_source, half_life_int=half_life)
+        return suggested, html
+
+    return derived("frag:suggest", sources, params, build)
+
+
+def stats_fragment(sorteos_url: str, jugadas_url: str) -> str:
+    """html del cuerpo de "Resumen estadístico"."""
+    def build():
+        current_hot, _, hot_from, hot_to = derived(
+            "current_hot", [("sorteos", sorteos_url)], (20, 6),
+            lambda: compute_current_hot(sorteos_url=sorteos_url, last_n_draws=20, top_k=6)
+        )
+        jugadas_summary, jugadas_recent = derived(
+            "jugadas_stats", [("sorteos", sorteos_url), ("jugadas", jugadas_url)], (20,),
+            lambda: compute_jugadas_stats(sorteos_url=sorteos_url, jugadas_url=jugadas_url, limit_recent=20)
+        )
+        return render_template("stats.html", current_hot=current_hot, current_hot_range=(hot_from, hot_to),
+                               jugadas_summary=jugadas_summary, jugadas_recent=jugadas_recent)
+
+    return derived("frag:stats", [("sorteos", sorteos_url), ("jugadas", jugadas_url)], (TEMPLATES_VERSION,), build)
+
+
+DAY_NAMES = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+MONTH_NAMES = ["enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto",
+               "septiembre", "octubre", "noviembre", "diciembre"]
+
+
+def plan_args(args):
+    """Parámetros del plan (página completa o fragmento)."""
+    hot_str = args.get("hot", "")
+    hot_count = args.get("hot_count", str(DEFAULT_HOT_COUNT))
+    start_date = parse_date_yyyy_mm_dd(args.get("start", ""))
+
+    # ✅ permitir secuencias
+    allow_seq = args.get("allow_seq", "0")  # 0=NO (estricto), 1=SI
+
+    try:
+        hot_count_int = int(hot_count)
+    except:
+        hot_count_int = DEFAULT_HOT_COUNT
+
+    return {
+        "hot_str": hot_str,
+        "hot_count_int": hot_count_int,
+        "start_date": start_date,
+        "allow_sequences": (allow_seq == "1"),
     }
 
-    function saveSettings(){
-      localStorage.setItem('miloto_hot', hotInput.value);
-      localStorage.setItem('miloto_hot_count', hotCount.value);
-      localStorage.setItem('miloto_start', startDate.value);
-      localStorage.setItem('miloto_sorteos_csv', sorteosCsv.value);
-      localStorage.setItem('miloto_jugadas_csv', jugadasCsv.value);
-      localStorage.setItem('miloto_topn', topN.value);
-      localStorage.setItem('miloto_min_played', minPlayed.value);
-      localStorage.setItem('miloto_allow_seq', allowSeq.value);
-      localStorage.setItem('miloto_draw', drawInput.value);
-      localStorage.setItem('miloto_stats', statsToggle.value);
+
+def sheets_args(args):
+    """Fuentes (tenant / CSV) y parámetros de sugerencia."""
+    # ✅ grupo (tenant): define qué Sheets se usan; los CSV libres solo si el registro lo permite
+    tenant, sorteos_url, jugadas_url, tenant_error = resolve_sources(
+        args.get("tenant", "").strip(),
+        args.get("sorteos_csv", "").strip(),
+        args.get("jugadas_csv", "").strip(),
+    )
+    top_n = args.get("topn", "6")
+    min_played = args.get("min_played", "1")
+    hot_source = args.get("hot_source", "history")   # history = opción C, decay = decaimiento
+    half_life = args.get("half_life", str(DEFAULT_HALF_LIFE))
+
+    try:
+        top_n_int = max(3, min(int(top_n), 12))
+    except:
+        top_n_int = 6
+
+    try:
+        min_played_int = max(0, min(int(min_played), 50))
+    except:
+        min_played_int = 1
+
+    try:
+        half_life_int = int(half_life) if int(half_life) in DECAY_HALF_LIVES else DEFAULT_HALF_LIFE
+    except:
+        half_life_int = DEFAULT_HALF_LIFE
+
+    if hot_source != "decay":
+        hot_source = "history"
+
+    return {
+        "tenant": tenant,
+        "sorteos_url": sorteos_url,
+        "jugadas_url": jugadas_url,
+        "tenant_error": tenant_error,
+        "top_n_int": top_n_int,
+        "min_played_int": min_played_int,
+        "hot_source": hot_source,
+        "half_life_int": half_life_int,
     }
 
-    function goGenerate(extraParams = {}){
-      const params = new URLSearchParams();
 
-      if(startDate.value) params.set('start', startDate.value);
-      if(hotInput.value.trim().length > 0) params.set('hot', hotInput.value.trim());
-      params.set('hot_count', hotCount.value);
+def build_plan(hot_str: str, hot_count: int, allow_sequences: bool, start_date):
+    """(calendar, error): [(fecha, n apuestas, combos), ...] del plan quincenal."""
+    error = None
+    try:
+        hot_numbers = parse_int_list(hot_str) if hot_str else DEFAULT_HOT
+    except Exception as e:
+        error = str(e)
+        hot_numbers = DEFAULT_HOT
 
-      params.set('allow_seq', allowSeq.value);
+    base = start_date or datetime.now().date()
+    start_monday = monday_of_week(base)
 
-      if(drawInput.value.trim().length > 0) params.set('draw', drawInput.value.trim());
+    draw_dates = build_draw_dates(start_monday)
 
-      // ✅ NUEVO: resumen stats
-      params.set('stats', statsToggle.value);
+    week1 = draw_dates[:4]
+    week2 = draw_dates[4:]
+    w1 = weekly_weights_for_dates(week1)
+    w2 = weekly_weights_for_dates(week2)
 
-      if(sorteosCsv.value.trim().length > 0) params.set('sorteos_csv', sorteosCsv.value.trim());
-      if(jugadasCsv.value.trim().length > 0) params.set('jugadas_csv', jugadasCsv.value.trim());
-      params.set('topn', topN.value);
-      params.set('min_played', minPlayed.value);
+    day_plan = [(d, w1[d]) for d in week1] + [(d, w2[d]) for d in week2]
+    total_bets = sum(n for _, n in day_plan)
 
-      for (const [k,v] of Object.entries(extraParams)) {
-        params.set(k, v);
-      }
+    combos = []
+    seen = set()
+    while len(combos) < total_bets:
+        c = tuple(generate_combination(hot_numbers, hot_count, allow_sequences))
+        if c in seen:
+            continue
+        seen.add(c)
+        combos.append(list(c))
 
-      window.location = '/?' + params.toString();
-    }
+    calendar = []
+    idx = 0
+    for d, n in day_plan:
+        assigned = combos[idx: idx + n]
+        idx += n
+        calendar.append((d, n, assigned))
+    return calendar, error
 
-    saveBtn.addEventListener('click', () => {
-      saveSettings();
-      alert('Listo: guardado en tu navegador ✅');
-    });
-
-    genBtn.addEventListener('click', () => {
-      saveSettings();
-      goGenerate();
-    });
-
-    suggestBtn.addEventListener('click', () => {
-      saveSettings();
-      goGenerate({use_suggested: "1"});
-    });
-
-    checkBtn.addEventListener('click', () => {
-      saveSettings();
-      goGenerate();
-    });
-
-    statsBtn.addEventListener('click', () => {
-      saveSettings();
-      goGenerate();
-    });
-
-    loadSettings();
-  </script>
-</body>
-</html>
-"""
 
-    class RowObj:
-        def __init__(self, d):
-            self.__dict__.update(d)
+def verify_plan(plan, draw_nums):
+    """plan = [(fecha, combo), ...] -> filas de verificación contra un resultado."""
+    draw_set = set(draw_nums)
+    verify_rows = []
+    for d, c in plan:
+        hits = len(set(c) & draw_set)
+        verify_rows.append({
+            "date": d,
+            "combo": c,
+            "hits": hits,
+            "msg": classify_hits(hits)
+        })
+    return verify_rows
+
+
+@app.route("/", methods=["GET"])
+def index():
+    # UI params
+    plan = plan_args(request.args)
+
+    # ✅ resultado del sorteo para verificar aciertos
+    draw_result_str = request.args.get("draw", "").strip()
+    draw_nums = parse_draw_result(draw_result_str)
+
+    # ✅ NUEVO: cargar resumen estadístico desde Sheets
+    load_stats = request.args.get("stats", "0")  # 1=SI
+    stats_enabled = (load_stats == "1")
+
+    # Sheets params
+    src = sheets_args(request.args)
+    sorteos_url, jugadas_url = src["sorteos_url"], src["jugadas_url"]
+    use_suggested = request.args.get("use_suggested", "0")
+
+    hot_str = plan["hot_str"]
+    sheets_error = src["tenant_error"]
+    suggest_html = None
+
+    # Stats UI
+    stats_error = None
+    stats_html = None
+
+    # ✅ si faltan ambas fuentes, se bajan a la vez
+    if use_suggested == "1" or stats_enabled:
+        prefetch_sources([("sorteos", sorteos_url), ("jugadas", jugadas_url)])
+
+    # ✅ las tarjetas de datos salen ya renderizadas del caché (solo plan y verificación se arman aquí)
+    if use_suggested == "1":
+        try:
+            suggested_hot, suggest_html = suggest_fragment(
+                sorteos_url, jugadas_url, src["hot_source"], src["top_n_int"], src["min_played_int"],
+                src["half_life_int"]
+            )
+            hot_str = ", ".join(str(x) for x in suggested_hot)
+        except Exception as e:
+            sheets_error = f"No pude leer/parsear tus CSV: {e}"
+
+    # ✅ cargar resumen si está activo
+    if stats_enabled:
+        try:
+            stats_html = stats_fragment(sorteos_url, jugadas_url)
+        except Exception as e:
+            stats_error = f"No pude calcular stats desde Sheets: {e}"
 
-    hot_stats_table_obj = [RowObj(x) for x in hot_stats_table] if hot_stats_table else None
-    verify_rows_obj = [RowObj(x) for x in verify_rows] if verify_rows else None
+    # ✅ "datos al": cuándo se descargaron las fuentes que se usaron
+    data_stamp = None
+    if use_suggested == "1" or stats_enabled:
+        data_stamp = data_as_of([("sorteos", sorteos_url), ("jugadas", jugadas_url)])
 
-    current_hot_table_obj = [RowObj(x) for x in current_hot_table] if current_hot_table else None
-    jugadas_recent_obj = [RowObj(x) for x in jugadas_recent] if jugadas_recent else None
+    calendar, error = build_plan(hot_str, plan["hot_count_int"], plan["allow_sequences"], plan["start_date"])
 
-    jugadas_summary_obj = RowObj(jugadas_summary) if jugadas_summary else None
+    # ✅ Verificación de aciertos (si el usuario metió resultado)
+    verify_rows = None
+    draw_invalid = False
+    if draw_result_str:
+        if not draw_nums:
+            draw_invalid = True
+        else:
+            verify_rows = verify_plan([(d, c) for d, _, cs in calendar for c in cs], draw_nums)
 
-    return render_template_string(
-        html,
+    # Jinja resuelve r.campo también sobre dicts: no hace falta envolver cada fila
+    return render_template(
+        "page.html",
         calendar=calendar,
-        day_names=day_names,
-        month_names=month_names,
+        day_names=DAY_NAMES,
+        month_names=MONTH_NAMES,
         payroll_days=PAYROLL_DAYS,
         hot_str=hot_str,
-        hot_count_int=hot_count_int,
+        hot_count_int=plan["hot_count_int"],
         error=error,
-        start_str=(start_date.isoformat() if start_date else ""),
+        start_str=(plan["start_date"].isoformat() if plan["start_date"] else ""),
         sorteos_url=sorteos_url,
         jugadas_url=jugadas_url,
-        top_n_int=top_n_int,
-        min_played_int=min_played_int,
+        top_n_int=src["top_n_int"],
+        min_played_int=src["min_played_int"],
         sheets_error=sheets_error,
-        hot_stats_table=hot_stats_table_obj,
-        allow_sequences=allow_sequences,
+        suggest_html=(Markup(suggest_html) if suggest_html else None),
+        hot_source=src["hot_source"],
+        half_life_int=src["half_life_int"],
+        decay_half_lives=DECAY_HALF_LIVES,
+        allow_sequences=plan["allow_sequences"],
         draw_result_str=draw_result_str,
         draw_invalid=draw_invalid,
-        verify_rows=verify_rows_obj,
+        verify_rows=verify_rows,
         # ✅ stats
         stats_enabled=stats_enabled,
         stats_error=stats_error,
-        current_hot=current_hot,
-        current_hot_table=current_hot_table_obj,
-        current_hot_range=current_hot_range,
-        jugadas_summary=jugadas_summary_obj,
-        jugadas_recent=jugadas_recent_obj
+        stats_html=(Markup(stats_html) if stats_html else None),
+        data_stamp=data_stamp,
+        tenant=src["tenant"],
+        tenant_name=(REGISTRY["tenants"][src["tenant"]]["name"] if src["tenant"] else None),
+        allow_custom_csv=REGISTRY["allow_custom_csv"]
     )
 
 
+# ---------- Fragmentos por tarjeta (actualización parcial desde la página) ----------
+
+def _fragment_stamp(src) -> str | None:
+    """El "datos al" de las fuentes del fragmento, para actualizarlo en la página."""
+    stamp = data_as_of([("sorteos", src["sorteos_url"]), ("jugadas", src["jugadas_url"])])
+    return stamp.strftime("%Y-%m-%d %H:%M") if stamp else None
+
+
+@app.route("/fragment/plan", methods=["GET"])
+def fragment_plan():
+    """Tarjetas del plan; mismos params que "/" (hot, hot_count, allow_seq, start)."""
+    plan = plan_args(request.args)
+    calendar, error = build_plan(plan["hot_str"], plan["hot_count_int"], plan["allow_sequences"],
+                                 plan["start_date"])
+    html = render_template("plan.html", calendar=calendar, day_names=DAY_NAMES, month_names=MONTH_NAMES,
+                           payroll_days=PAYROLL_DAYS)
+    return jsonify(ok=True, html=html, error=error)
+
+
+@app.route("/fragment/verify", methods=["POST"])
+def fragment_verify():
+    """
+    Aciertos del plan que ya está en pantalla, sin regenerarlo:
+    {"draw": "04-05-06-17-36", "plan": [["2026-10-19", "3-4-19-32-33"], ...]}.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(ok=False, error="Se esperaba JSON"), 400
+    draw_str = str(data.get("draw") or "").strip()
+    draw_nums = parse_draw_result(draw_str)
+    items = data.get("plan") or []
+    if not isinstance(items, list) or len(items) > 100:
+        return jsonify(ok=False, error="Plan inválido"), 400
+    plan = []
+    for item in items:
+        try:
+            d = parse_date_yyyy_mm_dd(str(item[0]))
+            combo = parse_draw_result(str(item[1]))
+        except (TypeError, IndexError, KeyError):
+            d = combo = None
+        if not d or not combo:
+            return jsonify(ok=False, error="Plan inválido"), 400
+        plan.append((d, combo))
+
+    verify_rows = verify_plan(plan, draw_nums) if draw_nums else None
+    # sin resultado escrito no hay nada que avisar: fragmento vacío
+    html = render_template("verify.html", draw_invalid=bool(draw_str) and not draw_nums, verify_rows=verify_rows,
+                           day_names=DAY_NAMES)
+    return jsonify(ok=True, html=html)
+
+
+@app.route("/fragment/suggest", methods=["GET"])
+def fragment_suggest():
+    """Tabla "Top sugerencias" + lista de hot sugeridos (del caché de fragmentos)."""
+    src = sheets_args(request.args)
+    if src["tenant_error"]:
+        return jsonify(ok=False, error=src["tenant_error"]), 404
+    prefetch_sources([("sorteos", src["sorteos_url"]), ("jugadas", src["jugadas_url"])])
+    try:
+        suggested_hot, html = suggest_fragment(
+            src["sorteos_url"], src["jugadas_url"], src["hot_source"], src["top_n_int"],
+            src["min_played_int"], src["half_life_int"]
+        )
+    except Exception as e:
+        return jsonify(ok=False, error=f"No pude leer/parsear tus CSV: {e}"), 503
+    return jsonify(ok=True, html=html, hot=", ".join(str(x) for x in suggested_hot),
+                   data_stamp=_fragment_stamp(src))
+
+
+@app.route("/fragment/stats", methods=["GET"])
+def fragment_stats():
+    """Cuerpo de "Resumen estadístico" (del caché de fragmentos)."""
+    src = sheets_args(request.args)
+    if src["tenant_error"]:
+        return jsonify(ok=False, error=src["tenant_error"]), 404
+    prefetch_sources([("sorteos", src["sorteos_url"]), ("jugadas", src["jugadas_url"])])
+    try:
+        html = stats_fragment(src["sorteos_url"], src["jugadas_url"])
+    except Exception as e:
+        return jsonify(ok=False, error=f"No pude calcular stats desde Sheets: {e}"), 503
+    return jsonify(ok=True, html=html, data_stamp=_fragment_stamp(src))
+
+
+# ---------- API de ingesta ----------
+
+def _ingest_denied():
+    """None si el token es válido; si no, la respuesta de error."""
+    if not INGEST_TOKEN:
+        return jsonify(ok=False, error="Ingesta deshabilitada (falta MILOTO_INGEST_TOKEN)"), 403
+    auth = request.headers.get("Authorization", "")
+    token = auth[7:] if auth.startswith("Bearer ") else request.headers.get("X-Ingest-Token", "")
+    if not hmac.compare_digest(token.encode(), INGEST_TOKEN.encode()):
+        return jsonify(ok=False, error="Token inválido"), 401
+    return None
+
+
+def _ingest_payload():
+    data = request.get_json(silent=True)
+    return data if isinstance(data, dict) else request.form
+
+
+@app.route("/api/ingest/draw", methods=["POST"])
+def api_ingest_draw():
+    """Recibe un resultado: {"fecha": "2026-10-19", "resultado": "04-05-06-17-36", "tenant": "..."}."""
+    denied = _ingest_denied()
+    if denied:
+        return denied
+    data = _ingest_payload()
+    d = parse_date_flexible(data.get("fecha") or data.get("date") or "")
+    nums = parse_draw_result(data.get("resultado") or data.get("draw") or "")
+    if not d or not nums:
+        return jsonify(ok=False, error="Fecha o resultado inválido (5 números 1..39 sin repetir)"), 400
+
+    tenant, sorteos_url, _, tenant_error = resolve_sources(str(data.get("tenant", "")), "", "")
+    if tenant_error:
+        return jsonify(ok=False, error=tenant_error), 404
+    try:
+        added = ingest_draw(sorteos_url, d, nums)
+    except IngestConflict as e:
+        return jsonify(ok=False, error=str(e)), 409
+    except OSError as e:
+        return jsonify(ok=False, error=f"No pude guardar el historial local: {e}"), 503
+    return jsonify(ok=True, added=added, tenant=tenant, fecha=d.isoformat(), resultado=sorted(nums),
+                   version=loaded_version("sorteos", sorteos_url))
+
+
+@app.route("/api/ingest/jugadas", methods=["POST"])
+def api_ingest_jugadas():
+    """Recibe jugadas: {"fecha": "2026-10-19", "jugadas": ["3-4-19-32-33", ...], "tenant": "..."}."""
+    denied = _ingest_denied()
+    if denied:
+        return denied
+    data = _ingest_payload()
+    d = parse_date_flexible(data.get("fecha") or data.get("date") or "")
+    raw = data.get("jugadas") or ""
+    if hasattr(data, "getlist") and len(data.getlist("jugadas")) > 1:
+        raw = data.getlist("jugadas")
+    items = raw if isinstance(raw, list) else str(raw).splitlines()
+    combos = [parse_draw_result(str(x)) for x in items if str(x).strip()]
+    if not d or not combos or not all(combos):
+        return jsonify(ok=False, error="Fecha o jugadas inválidas (cada una: 5 números 1..39 sin repetir)"), 400
+
+    tenant, _, jugadas_url, tenant_error = resolve_sources(str(data.get("tenant", "")), "", "")
+    if tenant_error:
+        return jsonify(ok=False, error=tenant_error), 404
+    try:
+        added = ingest_jugadas(jugadas_url, d, combos)
+    except OSError as e:
+        return jsonify(ok=False, error=f"No pude guardar el historial local: {e}"), 503
+    return jsonify(ok=True, added=added, tenant=tenant, fecha=d.isoformat(),
+                   version=loaded_version("jugadas", jugadas_url))
+
+
+# ---------- API de boletos masivos ----------
+
+@app.route("/api/tickets.csv", methods=["GET"])
+def api_tickets_csv():
+    """
+    N boletos distintos que cumplen las reglas del plan, en CSV (streaming).
+    Params: n, game (miloto por defecto), hot, hot_count, allow_seq, seed (opcional, para repetir la muestra).
+    """
+    game = GAMES.get(request.args.get("game") or DEFAULT_GAME)
+    if game is None:
+        return jsonify(ok=False, error=f"Juego desconocido; opciones: {', '.join(GAMES)}"), 400
+    try:
+        n = int(request.args.get("n", "100"))
+    except ValueError:
+        return jsonify(ok=False, error="n debe ser un entero"), 400
+    if n < 1 or n > BULK_MAX_TICKETS:
+        return jsonify(ok=False, error=f"n debe estar entre 1 y {BULK_MAX_TICKETS}"), 400
+    try:
+        hot_numbers = parse_int_list(request.args.get("hot", ""), game.max_number) or DEFAULT_HOT
+    except ValueError as e:
+        return jsonify(ok=False, error=str(e)), 400
+    try:
+        hot_count = int(request.args.get("hot_count", str(DEFAULT_HOT_COUNT)))
+    except ValueError:
+        hot_count = DEFAULT_HOT_COUNT
+    allow_sequences = request.args.get("allow_seq", "0") == "1"
+    seed = request.args.get("seed") or None
+
+    tickets = sample_tickets(hot_numbers, hot_count, allow_sequences, n, seed=seed, game=game)
+
+    def rows():
+        yield ",".join(f"N{i}" for i in range(1, game.picks + 1)) + "\n"
+        buf = []
+        for c in tickets:
+            buf.append(",".join(str(x) for x in c))
+            if len(buf) >= 1000:
+                yield "\n".join(buf) + "\n"
+                buf = []
+        if buf:
+            yield "\n".join(buf) + "\n"
+
+    return app.response_class(rows(), mimetype="text/csv", headers={
+        "Content-Disposition": f"attachment; filename={game.id}_{n}_boletos.csv",
+    })
+
+
+@app.route("/api/verify", methods=["POST"])
+def api_verify():
+    """
+    Verifica un CSV de boletos (campo `file` multipart o el cuerpo como text/csv).
+    Con `draw` compara todo contra ese resultado; sin `draw`, cada boleto contra el sorteo
+    de su fecha en SORTEOS (tenant / sorteos_csv). Params: min_hits (filas a devolver).
+    """
+    if (request.content_length or 0) > VERIFY_MAX_BYTES:
+        return jsonify(ok=False, error=f"Archivo demasiado grande (máx. {VERIFY_MAX_BYTES // (1024 * 1024)} MB)"), 413
+    draw_str = (request.args.get("draw") or request.form.get("draw") or "").strip()
+    draw_nums = parse_draw_result(draw_str) if draw_str else None
+    if draw_str and not draw_nums:
+        return jsonify(ok=False, error="Resultado inválido (5 números 1..39 sin repetir)"), 400
+    try:
+        min_hits = max(0, min(int(request.args.get("min_hits", "2")), NUM_NUMBERS))
+    except ValueError:
+        return jsonify(ok=False, error="min_hits debe ser un entero"), 400
+
+    sorteos = None
+    tenant = None
+    if not draw_nums:
+        tenant, sorteos_url, _, tenant_error = resolve_sources(
+            request.args.get("tenant", "").strip(), request.args.get("sorteos_csv", "").strip(), ""
+        )
+        if tenant_error:
+            return jsonify(ok=False, error=tenant_error), 404
+        try:
+            sorteos = get_table(sorteos_url, "sorteos")
+        except Exception as e:
+            return jsonify(ok=False, error=f"No pude cargar SORTEOS: {e}"), 503
+
+    upload = request.files.get("file")
+    stream = upload.stream if upload else request.stream
+    lines = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace", newline="")
+    t0 = time.perf_counter()
+    try:
+        result = verify_tickets(lines, draw_nums=draw_nums, sorteos=sorteos, min_hits=min_hits)
+    except ValueError as e:
+        return jsonify(ok=False, error=str(e)), 400
+    finally:
+        lines.detach()
+
+    return jsonify(
+        ok=True,
+        mode="resultado" if draw_nums else "historia",
+        resultado=sorted(draw_nums) if draw_nums else None,
+        tenant=tenant,
+        labels={h: classify_hits(h) for h in result["dist"]},
+        # lo que daría el azar (hipergeométrica) para la misma cantidad de boletos
+        expected={h: round(p * result["total"], 2)
+                  for h, p in enumerate(hypergeometric_table(NUM_NUMBERS, MAX_NUMBER))},
+        elapsed_ms=round((time.perf_counter() - t0) * 1000, 1),
+        **result,
+    )
+
+
+def _post_ingest(server: str, path: str, payload: dict):
+    req = urllib.request.Request(
+        server.rstrip("/") + path,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {INGEST_TOKEN}"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=FETCH_TIMEOUT * 3) as resp:
+            return resp.read().decode("utf-8")
+    except urllib.error.HTTPError as e:
+        raise click.ClickException(e.read().decode("utf-8", errors="replace"))
+
+
+@app.cli.command("ingest-draw")
+@click.argument("fecha")
+@click.argument("resultado")
+@click.option("--tenant", default="", help="Grupo del registro (MILOTO_TENANTS).")
+@click.option("--server", default="", help="URL de la app corriendo; si se omite, se escribe en el historial local.")
+def ingest_draw_command(fecha, resultado, tenant, server):
+    """Ingresa un resultado, ej: flask --app app ingest-draw 2026-10-19 04-05-06-17-36"""
+    if server:
+        click.echo(_post_ingest(server, "/api/ingest/draw", {"fecha": fecha, "resultado": resultado, "tenant": tenant}))
+        return
+    d, nums = parse_date_flexible(fecha), parse_draw_result(resultado)
+    if not d or not nums:
+        raise click.BadParameter("Fecha o resultado inválido")
+    _, sorteos_url, _, tenant_error = resolve_sources(tenant, "", "")
+    if tenant_error:
+        raise click.ClickException(tenant_error)
+    try:
+        added = ingest_draw(sorteos_url, d, nums)
+    except IngestConflict as e:
+        raise click.ClickException(str(e))
+    save_snapshot()
+    click.echo("Agregado." if added else "Ya estaba cargado.")
+
+
+@app.cli.command("ingest-jugadas")
+@click.argument("fecha")
+@click.argument("jugadas", nargs=-1, required=True)
+@click.option("--tenant", default="", help="Grupo del registro (MILOTO_TENANTS).")
+@click.option("--server", default="", help="URL de la app corriendo; si se omite, se escribe en el historial local.")
+def ingest_jugadas_command(fecha, jugadas, tenant, server):
+    """Ingresa jugadas, ej: flask --app app ingest-jugadas 2026-10-19 3-4-19-32-33 1-8-10-19-28"""
+    if server:
+        click.echo(_post_ingest(server, "/api/ingest/jugadas", {"fecha": fecha, "jugadas": list(jugadas), "tenant": tenant}))
+        return
+    d = parse_date_flexible(fecha)
+    combos = [parse_draw_result(j) for j in jugadas]
+    if not d or not all(combos):
+        raise click.BadParameter("Fecha o jugadas inválidas")
+    _, _, jugadas_url, tenant_error = resolve_sources(tenant, "", "")
+    if tenant_error:
+        raise click.ClickException(tenant_error)
+    added = ingest_jugadas(jugadas_url, d, combos)
+    save_snapshot()
+    click.echo(f"{added} jugada(s) agregada(s).")
+
+
+@app.cli.command("build-tables")
+@click.option("--game", "game_ids", multiple=True, help="Juego (repetible); por defecto todos.")
+def build_tables_command(game_ids):
+    """Construye (si faltan) las tablas precalculadas de cada juego en MILOTO_TABLES_DIR."""
+    for gid in game_ids or GAMES:
+        if gid not in GAMES:
+            raise click.BadParameter(f"Juego desconocido: {gid}")
+        game = GAMES[gid]
+        started = time.perf_counter()
+        tables = game_tables(game)
+        path = game_tables_path(game)
+        click.echo(f"[{gid}] {len(tables['masks'])} combinaciones, {os.path.getsize(path) / 1024 / 1024:.1f} MiB "
+                   f"en {time.perf_counter() - started:.1f}s — {path}")
+
+
+@app.cli.command("memory-report")
+@click.option("--rows", default=10000, show_default=True, help="Filas sintéticas a medir.")
+def memory_report(rows):
+    """Mide memoria de filas como dicts vs tablas compactas y lista las fuentes cargadas."""
+    as_dicts, as_table = measure_memory(rows)
+    click.echo(f"{rows} filas como dicts de DictReader: {as_dicts / 1024:.1f} KiB")
+    click.echo(f"{rows} filas como DrawTable:          {as_table / 1024:.1f} KiB")
+    click.echo(f"Reducción: {as_dicts / max(as_table, 1):.1f}x")
+    with _data_lock:
+        loaded = list(_datasets.items())
+    for (kind, url), entry in loaded:
+        t = entry["table"]
+        click.echo(f"[{kind}] {len(t)} filas, {t.nbytes() / 1024:.1f} KiB — {url}")
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
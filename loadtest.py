@@ -0,0 +1,307 @@
+"""
+Prueba de carga de la app completa.
+
+- Levanta un servidor local que imita los CSV de Google Sheets (keep-alive, gzip si se pide,
+  latencia y tasa de fallos configurables).
+- Arranca la app con gunicorn en localhost apuntando a ese servidor (o usa --target si ya está corriendo).
+- Repite mezclas realistas de requests a "/" con concurrencia creciente y reporta
+  throughput, p50/p95/p99 y tasa de error por escenario.
+
+Uso:
+    python loadtest.py --workers 2 --concurrency 1,4,16 --duration 10 --latency-ms 300 --fail-rate 0.05
+"""
+import argparse
+import gzip
+import http.server
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# "/" responde 200 aunque Sheets falle: el fallo se ve como aviso en la página
+DEGRADED_MARKERS = (b"<b>Google Sheets:</b>", b"<b>Stats:</b>")
+
+# nombre -> (peso en la mezcla "mix", params extra)
+SCENARIOS = {
+    "plan": (50, {}),
+    "draw": (20, {"draw": "04-05-06-17-36"}),
+    "stats": (20, {"stats": "1"}),
+    "suggested": (10, {"use_suggested": "1"}),
+}
+
+
+# ---------- Sheets de mentira ----------
+
+def build_fake_csvs(draws: int, tickets_per_draw: int, seed: int = 7):
+    """CSV sintéticos con el mismo formato que EXPORT_SORTEOS y JUGADAS."""
+    rnd = random.Random(seed)
+    d = date.today() - timedelta(days=draws * 2)
+    sorteos = ["fecha_iso,N1,N2,N3,N4,N5"]
+    jugadas = ["FECHA,J1,J2,J3,J4,J5"]
+    for _ in range(draws):
+        nums = rnd.sample(range(1, 40), 5)
+        sorteos.append(d.isoformat() + "," + ",".join(str(n) for n in nums))
+        for _ in range(tickets_per_draw):
+            t = rnd.sample(range(1, 40), 5)
+            jugadas.append(d.strftime("%d/%m/%Y") + "," + ",".join(str(n) for n in t))
+        d += timedelta(days=rnd.choice([1, 2, 3]))
+    return ("\n".join(sorteos) + "\n").encode(), ("\n".join(jugadas) + "\n").encode()
+
+
+def start_fake_sheets(port: int, sorteos: bytes, jugadas: bytes, latency_ms: float, fail_rate: float):
+    counters = {"requests": 0, "failures": 0}
+    compressed = {sorteos: gzip.compress(sorteos), jugadas: gzip.compress(jugadas)}
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            with lock:
+                counters["requests"] += 1
+            if latency_ms > 0:
+                time.sleep(random.uniform(0.5, 1.5) * latency_ms / 1000.0)
+            if random.random() < fail_rate:
+                with lock:
+                    counters["failures"] += 1
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = sorteos if "sorteos" in self.path else jugadas
+            gzipped = "gzip" in (self.headers.get("Accept-Encoding") or "")
+            if gzipped:
+                body = compressed[body]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv; charset=utf-8")
+            if gzipped:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, counters
+
+
+# ---------- App bajo gunicorn ----------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 20.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as resp:
+                resp.read()
+                return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f"La app no respondió en {timeout:.0f}s: {url}")
+
+
+def start_gunicorn(port: int, workers: int, worker_class: str, threads: int, extra_args, env_extra):
+    env = dict(os.environ)
+    env.update(env_extra)
+    # por defecto igual que el startCommand de render.yaml
+    cmd = [sys.executable, "-m", "gunicorn", "-b", f"127.0.0.1:{port}", "-w", str(workers),
+           "--worker-class", worker_class, "--threads", str(threads), "--preload", "--timeout", "30",
+           "--log-level", "warning"] + list(extra_args) + ["app:app"]
+    return subprocess.Popen(cmd, cwd=HERE, env=env)
+
+
+# ---------- Carga ----------
+
+def percentile(sorted_vals, p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * p
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+def pick_scenario(name: str, rnd: random.Random) -> str:
+    if name != "mix":
+        return name
+    names = list(SCENARIOS)
+    weights = [SCENARIOS[n][0] for n in names]
+    return rnd.choices(names, weights=weights)[0]
+
+
+def build_query(scenario: str, base_params: dict, rnd: random.Random) -> str:
+    params = dict(base_params)
+    params["hot_count"] = str(rnd.choice([0, 1, 2, 3]))
+    params["allow_seq"] = rnd.choice(["0", "1"])
+    params.update(SCENARIOS[scenario][1])
+    return "/?" + urlencode(params)
+
+
+def fetch_page(url: str, timeout: float):
+    """(ok HTTP, página con aviso de Sheets/stats)."""
+    try:
+        req = urllib.request.Request(url, headers={"Accept-Encoding": "gzip"})
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            body = resp.read()
+            if resp.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            return resp.status == 200, any(m in body for m in DEGRADED_MARKERS)
+    except (urllib.error.URLError, OSError):
+        return False, False
+
+
+def run_step(target: str, scenario: str, concurrency: int, duration: float, base_params: dict, timeout: float):
+    """
+    Lanza `concurrency` clientes durante `duration` segundos. Devuelve métricas.
+    Cuenta como error tanto un status != 200 como una página con el aviso de Sheets/stats.
+    """
+    latencies = []
+    errors = 0
+    degraded = 0
+    lock = threading.Lock()
+    end = time.monotonic() + duration
+
+    def client(i):
+        nonlocal errors, degraded
+        rnd = random.Random(i)
+        local_lat, local_err, local_deg = [], 0, 0
+        while time.monotonic() < end:
+            url = target + build_query(pick_scenario(scenario, rnd), base_params, rnd)
+            t0 = time.perf_counter()
+            ok, warned = fetch_page(url, timeout)
+            local_lat.append(time.perf_counter() - t0)
+            if warned:
+                local_deg += 1
+            if not ok or warned:
+                local_err += 1
+        with lock:
+            latencies.extend(local_lat)
+            errors += local_err
+            degraded += local_deg
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    n = len(latencies)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": n,
+        "rps": n / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "error_rate": errors / n if n else 0.0,
+        "degraded": degraded,
+    }
+
+
+REPORT_HEADER = (f"{'escenario':<10} {'conc':>5} {'reqs':>7} {'req/s':>8} "
+                 f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'error':>7} {'avisos':>7}")
+
+
+def format_row(r) -> str:
+    return (f"{r['scenario']:<10} {r['concurrency']:>5} {r['requests']:>7} {r['rps']:>8.1f} "
+            f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['error_rate']:>6.1%} "
+            f"{r['degraded']:>7}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Prueba de carga MiLoto con Sheets locales.")
+    ap.add_argument("--target", help="URL base de una app ya corriendo (si no, se arranca gunicorn)")
+    ap.add_argument("--workers", type=int, default=2, help="workers de gunicorn")
+    ap.add_argument("--worker-class", default="gthread", help="clase de worker de gunicorn (como en render.yaml)")
+    ap.add_argument("--threads", type=int, default=16, help="hilos por worker de gunicorn (como en render.yaml)")
+    ap.add_argument("--gunicorn-arg", action="append", default=[], help="argumento extra para gunicorn (repetible)")
+    ap.add_argument("--scenarios", default="plan,draw,stats,suggested,mix",
+                    help=f"lista separada por comas entre: {', '.join(SCENARIOS)}, mix")
+    ap.add_argument("--concurrency", default="1,4,16,32", help="niveles de concurrencia, ej: 1,4,16")
+    ap.add_argument("--duration", type=float, default=10.0, help="segundos por escenario y nivel")
+    ap.add_argument("--timeout", type=float, default=30.0, help="timeout por request del cliente")
+    ap.add_argument("--latency-ms", type=float, default=200.0, help="latencia media de los Sheets falsos")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="fracción de descargas que fallan con 503")
+    ap.add_argument("--draws", type=int, default=1500, help="filas en SORTEOS")
+    ap.add_argument("--tickets-per-draw", type=int, default=6, help="jugadas por sorteo en JUGADAS")
+    ap.add_argument("--data-ttl", type=int, default=5,
+                    help="MILOTO_DATA_TTL para la app; corto para que cada paso vuelva a pasar por Sheets")
+    ap.add_argument("--json", help="guardar resultados en este archivo JSON")
+    args = ap.parse_args(argv)
+
+    sorteos, jugadas = build_fake_csvs(args.draws, args.tickets_per_draw)
+    sheets_port = free_port()
+    sheets, counters = start_fake_sheets(sheets_port, sorteos, jugadas, args.latency_ms, args.fail_rate)
+    base_params = {
+        "sorteos_csv": f"http://127.0.0.1:{sheets_port}/sorteos.csv",
+        "jugadas_csv": f"http://127.0.0.1:{sheets_port}/jugadas.csv",
+    }
+
+    proc = None
+    tmpdir = tempfile.mkdtemp(prefix="miloto_load_")
+    target = args.target
+    try:
+        if not target:
+            port = free_port()
+            # todo lo que la app escribe (snapshot, historial local, tablas) va al tmpdir
+            proc = start_gunicorn(port, args.workers, args.worker_class, args.threads, args.gunicorn_arg, {
+                "MILOTO_DATA_DIR": tmpdir,
+                "MILOTO_SNAPSHOT": os.path.join(tmpdir, "snapshot.pkl.gz"),
+                "MILOTO_LOCAL_HISTORY": os.path.join(tmpdir, "local_history.jsonl"),
+                "MILOTO_TABLES_DIR": os.path.join(tmpdir, "tables"),
+                "MILOTO_DATA_TTL": str(args.data_ttl),
+            })
+            target = f"http://127.0.0.1:{port}"
+        target = target.rstrip("/")
+        wait_until_up(target + "/")
+
+        results = []
+        print(REPORT_HEADER)
+        print("-" * len(REPORT_HEADER))
+        for scenario in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+            if scenario != "mix" and scenario not in SCENARIOS:
+                ap.error(f"escenario desconocido: {scenario}")
+            for conc in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+                r = run_step(target, scenario, conc, args.duration, base_params, args.timeout)
+                results.append(r)
+                print(format_row(r), flush=True)
+
+        print()
+        print(f"Descargas a Sheets falsos: {counters['requests']} (fallidas: {counters['failures']})")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"args": vars(args), "results": results, "upstream": counters}, f, indent=2)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        sheets.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+const hotInput = document.getElementById('hotInput');
+const hotCount = document.getElementById('hotCount');
+const startDate = document.getElementById('startDate');
+const sorteosCsv = document.getElementById('sorteosCsv');
+const jugadasCsv = document.getElementById('jugadasCsv');
+const topN = document.getElementById('topN');
+const minPlayed = document.getElementById('minPlayed');
+const hotSource = document.getElementById('hotSource');
+const halfLife = document.getElementById('halfLife');
+const allowSeq = document.getElementById('allowSeq');
+
+const drawInput = document.getElementById('drawInput');
+const tenantInput = document.getElementById('tenant');
+
+const statsToggle = document.getElementById('statsToggle');
+const statsBtn = document.getElementById('statsBtn');
+
+const saveBtn = document.getElementById('saveBtn');
+const genBtn  = document.getElementById('genBtn');
+const suggestBtn = document.getElementById('suggestBtn');
+const checkBtn = document.getElementById('checkBtn');
+
+// contenedores que se actualizan en el lugar (fragmentos)
+const hotError = document.getElementById('hotError');
+const planBox = document.getElementById('plan');
+const verifyResult = document.getElementById('verifyResult');
+const suggestResult = document.getElementById('suggestResult');
+const statsResult = document.getElementById('statsResult');
+const dataStamp = document.getElementById('dataStamp');
+
+function loadSettings(){
+  const savedHot = localStorage.getItem('miloto_hot');
+  const savedCount = localStorage.getItem('miloto_hot_count');
+  const savedStart = localStorage.getItem('miloto_start');
+  const savedSorteos = localStorage.getItem('miloto_sorteos_csv');
+  const savedJugadas = localStorage.getItem('miloto_jugadas_csv');
+  const savedTopN = localStorage.getItem('miloto_topn');
+  const savedMinPlayed = localStorage.getItem('miloto_min_played');
+  const savedHotSource = localStorage.getItem('miloto_hot_source');
+  const savedHalfLife = localStorage.getItem('miloto_half_life');
+  const savedAllowSeq = localStorage.getItem('miloto_allow_seq');
+  const savedDraw = localStorage.getItem('miloto_draw');
+  const savedStats = localStorage.getItem('miloto_stats');
+
+  if(savedHot && !hotInput.value) hotInput.value = savedHot;
+  if(savedCount) hotCount.value = savedCount;
+
+  if(savedStart && (!startDate.value || startDate.value.trim().length === 0)) {
+    startDate.value = savedStart;
+  }
+  if(!startDate.value || startDate.value.trim().length === 0){
+    const today = new Date();
+    const yyyy = today.getFullYear();
+    const mm = String(today.getMonth()+1).padStart(2,'0');
+    const dd = String(today.getDate()).padStart(2,'0');
+    startDate.value = `${yyyy}-${mm}-${dd}`;
+  }
+
+  if(savedSorteos && !sorteosCsv.readOnly && (!sorteosCsv.value || sorteosCsv.value.trim().length === 0)) sorteosCsv.value = savedSorteos;
+  if(savedJugadas && !jugadasCsv.readOnly && (!jugadasCsv.value || jugadasCsv.value.trim().length === 0)) jugadasCsv.value = savedJugadas;
+  if(savedTopN) topN.value = savedTopN;
+  if(savedMinPlayed) minPlayed.value = savedMinPlayed;
+  if(savedHotSource) hotSource.value = savedHotSource;
+  if(savedHalfLife) halfLife.value = savedHalfLife;
+  if(savedAllowSeq) allowSeq.value = savedAllowSeq;
+  if(savedDraw && (!drawInput.value || drawInput.value.trim().length === 0)) drawInput.value = savedDraw;
+  if(savedStats) statsToggle.value = savedStats;
+}
+
+function saveSettings(){
+  localStorage.setItem('miloto_hot', hotInput.value);
+  localStorage.setItem('miloto_hot_count', hotCount.value);
+  localStorage.setItem('miloto_start', startDate.value);
+  localStorage.setItem('miloto_sorteos_csv', sorteosCsv.value);
+  localStorage.setItem('miloto_jugadas_csv', jugadasCsv.value);
+  localStorage.setItem('miloto_topn', topN.value);
+  localStorage.setItem('miloto_min_played', minPlayed.value);
+  localStorage.setItem('miloto_hot_source', hotSource.value);
+  localStorage.setItem('miloto_half_life', halfLife.value);
+  localStorage.setItem('miloto_allow_seq', allowSeq.value);
+  localStorage.setItem('miloto_draw', drawInput.value);
+  localStorage.setItem('miloto_stats', statsToggle.value);
+}
+
+function currentParams(extraParams = {}){
+  const params = new URLSearchParams();
+
+  if(startDate.value) params.set('start', startDate.value);
+  if(hotInput.value.trim().length > 0) params.set('hot', hotInput.value.trim());
+  params.set('hot_count', hotCount.value);
+
+  params.set('allow_seq', allowSeq.value);
+
+  if(drawInput.value.trim().length > 0) params.set('draw', drawInput.value.trim());
+
+  // ✅ NUEVO: resumen stats
+  params.set('stats', statsToggle.value);
+
+  // ✅ grupo: sus Sheets vienen del servidor, no se mandan CSV libres
+  if(tenantInput) params.set('tenant', tenantInput.value);
+  if(!sorteosCsv.readOnly && sorteosCsv.value.trim().length > 0) params.set('sorteos_csv', sorteosCsv.value.trim());
+  if(!jugadasCsv.readOnly && jugadasCsv.value.trim().length > 0) params.set('jugadas_csv', jugadasCsv.value.trim());
+  params.set('topn', topN.value);
+  params.set('min_played', minPlayed.value);
+  params.set('hot_source', hotSource.value);
+  params.set('half_life', halfLife.value);
+
+  for (const [k,v] of Object.entries(extraParams)) {
+    params.set(k, v);
+  }
+  return params;
+}
+
+function goGenerate(extraParams = {}){
+  window.location = '/?' + currentParams(extraParams).toString();
+}
+
+// ✅ fragmentos: cada botón pide solo su tarjeta y la reemplaza en el lugar
+async function loadFragment(url, options = {}){
+  const resp = await fetch(url, options);
+  const data = await resp.json();
+  if(!resp.ok || !data.ok) throw new Error(data.error || `HTTP ${resp.status}`);
+  return data;
+}
+
+function showWarn(box, label, msg){
+  box.innerHTML = '';
+  const div = document.createElement('div');
+  div.className = 'warn';
+  div.style.marginTop = '10px';
+  const b = document.createElement('b');
+  b.textContent = label;
+  div.append(b, ' ', msg);
+  box.append(div);
+}
+
+function showHotError(msg){
+  hotError.innerHTML = '';
+  if(!msg) return;
+  const div = document.createElement('div');
+  div.className = 'error';
+  const b = document.createElement('b');
+  b.textContent = 'Error en tus números calientes:';
+  div.append(b, ' ', msg);
+  hotError.append(div);
+}
+
+function showDataStamp(stamp){
+  if(!stamp) return;
+  dataStamp.innerHTML = '';
+  const div = document.createElement('div');
+  div.className = 'note muted';
+  div.textContent = `Datos de Google Sheets al ${stamp} (se actualizan solos en segundo plano).`;
+  dataStamp.append(div);
+}
+
+function syncUrl(){
+  history.replaceState(null, '', '/?' + currentParams().toString());
+}
+
+async function refreshPlan(){
+  const data = await loadFragment('/fragment/plan?' + currentParams().toString());
+  planBox.innerHTML = data.html;
+  showHotError(data.error);
+  // el plan cambió: la verificación anterior ya no aplica
+  if(drawInput.value.trim().length > 0) await checkDraw();
+  else verifyResult.innerHTML = '';
+}
+
+async function checkDraw(){
+  const plan = [...planBox.querySelectorAll('.combo[data-combo]')]
+    .map(el => [el.dataset.date, el.dataset.combo]);
+  const data = await loadFragment('/fragment/verify', {
+    method: 'POST',
+    headers: {'Content-Type': 'application/json'},
+    body: JSON.stringify({draw: drawInput.value.trim(), plan}),
+  });
+  verifyResult.innerHTML = data.html;
+}
+
+async function suggestHot(){
+  try {
+    const data = await loadFragment('/fragment/suggest?' + currentParams().toString());
+    suggestResult.innerHTML = data.html;
+    hotInput.value = data.hot;
+    showDataStamp(data.data_stamp);
+    saveSettings();
+  } catch (e) {
+    showWarn(suggestResult, 'Google Sheets:', e.message);
+    return;
+  }
+  await refreshPlan();
+}
+
+async function refreshStats(){
+  if(statsToggle.value !== '1'){
+    statsResult.innerHTML = '';
+    return;
+  }
+  try {
+    const data = await loadFragment('/fragment/stats?' + currentParams().toString());
+    statsResult.innerHTML = data.html;
+    showDataStamp(data.data_stamp);
+  } catch (e) {
+    showWarn(statsResult, 'Stats:', e.message);
+  }
+}
+
+// si algo falla (red, servidor viejo), se recarga la página completa como antes
+function onClick(btn, action, fallbackParams = {}){
+  btn.addEventListener('click', async () => {
+    saveSettings();
+    btn.disabled = true;
+    try {
+      await action();
+      syncUrl();
+    } catch (e) {
+      goGenerate(fallbackParams);
+    } finally {
+      btn.disabled = false;
+    }
+  });
+}
+
+saveBtn.addEventListener('click', () => {
+  saveSettings();
+  alert('Listo: guardado en tu navegador ✅');
+});
+
+onClick(genBtn, refreshPlan);
+onClick(suggestBtn, suggestHot, {use_suggested: "1"});
+onClick(checkBtn, checkDraw);
+onClick(statsBtn, refreshStats);
+
+loadSettings();